@@ -8,8 +8,7 @@ from dynamic_reconfigure.msg import ConfigDescription
 from dynamic_reconfigure.msg import Group
 from dynamic_reconfigure.msg import GroupState
 from dynamic_reconfigure.msg import ParamDescription
-from dynamic_reconfigure.srv import Reconfigure
-from dynamic_reconfigure.srv import ReconfigureResponse
+from dynamic_reconfigure_tools.msg_server import MsgServer
 
 
 class ManualDr:
@@ -20,16 +19,11 @@ class ManualDr:
         ns = ns.replace('///', '/')
 
         rospy.loginfo('namespace: ' + ns)
-        self.pub = rospy.Publisher(ns + '/parameter_descriptions', ConfigDescription, queue_size=1, latch=True)
         self.cd = ConfigDescription()
         for name in ['test_bool', 'test_bool2']:
-            bool_param = BoolParameter()
-            bool_param.name = name
-            bool_param.value = True
-            self.cd.dflt.bools.append(bool_param)
-            self.cd.max.bools.append(bool_param)
-            bool_param.value = False
-            self.cd.min.bools.append(bool_param)
+            self.cd.dflt.bools.append(BoolParameter(name, True))
+            self.cd.max.bools.append(BoolParameter(name, True))
+            self.cd.min.bools.append(BoolParameter(name, False))
 
         group_names = ['Default', 'Test']
 
@@ -71,28 +65,17 @@ class ManualDr:
         group.parameters.append(param)
         self.cd.groups.append(group)
 
-        self.pub.publish(self.cd)
+        # publishes the description and the full config on every change,
+        # and handles set_parameters
+        self.server = MsgServer(self.cd, self.handle_reconfigure, namespace=ns)
 
         self.sub = rospy.Subscriber(ns + '/parameter_updates', Config, self.update, queue_size=1)
-        self.update_pub = rospy.Publisher(ns + '/parameter_updates', Config, queue_size=1)
-        self.srv = rospy.Service(ns + '/set_parameters', Reconfigure, self.handle_reconfigure)
-
-    def handle_reconfigure(self, req):
-        rospy.loginfo(req)
-
-        for b_param in req.config.bools:
-            for i in range(len(self.cd.dflt.bools)):
-                if b_param.name == self.cd.dflt.bools[i].name:
-                    self.cd.dflt.bools[i].value = b_param.value
-                    print("new value " + b_param.name + " " + str(self.cd.dflt.bools[i].value))
-        # TODO(lucasw)
-        # this will get all the updates to every subscriber that has been listening
-        # since the beginning, but need all the parameters for new subscribers
-        self.update_pub.publish(self.cd.dflt)
-        # self.pub.publish(self.cd)
-
-        resp = ReconfigureResponse()
-        return resp
+
+    # only gets the parameters that changed
+    def handle_reconfigure(self, changes, level):
+        for name, value in changes.items():
+            print("new value " + name + " " + str(value))
+        return changes
 
     def update(self, msg):
         rospy.loginfo(msg)
@@ -1,14 +1,13 @@
 /// example dynamic reconfigure server
 
+use dynamic_reconfigure_tools::param_store::{ParamStore, Value};
+use dynamic_reconfigure_tools::server::Server;
 use std::collections::HashMap;
 use tracing_subscriber;
 
-roslibrust_codegen_macro::find_and_generate_ros_messages!();
-
 #[tokio::main]
 async fn main() -> Result<(), anyhow::Error> {
-    use roslibrust::ros1::{NodeHandle, Publisher};
-    use std::sync::{Arc, Mutex};
+    use roslibrust::ros1::NodeHandle;
 
     let tracing_sub = tracing_subscriber::fmt().finish();
     tracing::subscriber::set_global_default(tracing_sub)?;
@@ -52,91 +51,14 @@ async fn main() -> Result<(), anyhow::Error> {
     let nh = NodeHandle::new(&ros_master_uri, full_node_name).await?;
     tracing::info!("connected to roscore at {ros_master_uri}");
 
-    // Dynamic reconfigure service and topics
-    let full_server_name = &format!(
-        "/{}/set_parameters",
-        &full_node_name,
-        )
-        .replace("//", "/")
-        .replace("set_parameters/set_parameters", "set_parameters");
-
-    let mut config_description = dynamic_reconfigure::ConfigDescription::default();
-    let config_state = Arc::new(Mutex::new(dynamic_reconfigure::Config::default()));
-    // TODO(lucasw) set up a few parameters so they can be set
-    {
-        let mut config = config_state.lock().unwrap();
-        let str_param = dynamic_reconfigure::StrParameter {
-            name: "foo".to_string(),
-            value: "bar".to_string(),
-        };
-
-        let mut group = dynamic_reconfigure::Group::default();
-        group.name = "Default".to_string();
-        let str_param_description = dynamic_reconfigure::ParamDescription {
-            name: str_param.name.clone(),
-            r#type: "str".to_string(),
-            level: 1,
-            description: "test str".to_string(),
-            edit_method: "".to_string(),
-        };
-        group.parameters.push(str_param_description);
-
-        // Don't need a max string but it's there anyhow, assume the min/max values don't matter
-        config_description.min.strs.push(str_param.clone());
-        config_description.max.strs.push(str_param.clone());
-        config_description.dflt.strs.push(str_param.clone());
-        config.strs.push(str_param);
-
-        let mut group_state = dynamic_reconfigure::GroupState::default();
-        group_state.name = group.name.clone();
-        group_state.state = true;
-        config_description.min.groups.push(group_state.clone());
-        config_description.max.groups.push(group_state.clone());
-        config_description.dflt.groups.push(group_state.clone());
-        config_description.groups.push(group);
-
-        config.groups.push(group_state);
-    }
-    tracing::info!("Initial config: {config_state:?}");
-
-    // TODO(lucasw) need these to be latched, but maybe just regularly publishing will work
-    let latch = true;
-    let update_pub: Publisher<dynamic_reconfigure::Config> = nh.advertise(&format!("{}/parameter_updates", full_node_name.as_str()), 3, latch).await?;
-    let do_update_pub = Arc::new(Mutex::new(true));
-    let description_pub: Publisher<dynamic_reconfigure::ConfigDescription> = nh.advertise(&format!("{}/parameter_descriptions", full_node_name.as_str()), 3, latch).await?;
+    let mut store = ParamStore::new();
+    store.add("foo", Value::Str("bar".to_string()), Value::Str("".to_string()), Value::Str("".to_string()), 1, "test str")?;
+    store.add("gain", Value::Double(1.0), Value::Double(0.0), Value::Double(10.0), 1, "test double")?;
+    store.add("count", Value::Int(3), Value::Int(0), Value::Int(100), 1, "test int")?;
+    store.add("enable", Value::Bool(true), Value::Bool(false), Value::Bool(true), 1, "test bool")?;
+    tracing::info!("Initial config: {:?}", store.config());
 
-    let config_state_copy = config_state.clone();
-    let do_update_pub_copy = do_update_pub.clone();
-    let server_fn = move |request: dynamic_reconfigure::ReconfigureRequest| {
-        tracing::info!("{request:?}");
-
-        let mut config = config_state_copy.lock().unwrap();
-
-        // TODO(lucasw) need a hashmap as base structure so don't have to do double for loops
-        // - then convert it to and from Config as needed
-        // for intv in request.config.ints {
-        // }
-        'outer: for req_strv in request.config.strs {
-            for strv in &mut config.strs {
-                if req_strv.name == strv.name {
-                    // TODO(lucasw) also need to clip to min max values
-                    tracing::info!("set {} value {} to {}", strv.name, strv.value, req_strv.value);
-                    strv.value = req_strv.value;
-                    break 'outer
-                }
-            }
-        }
-        *do_update_pub_copy.lock().unwrap() = true;
-
-        Ok(dynamic_reconfigure::ReconfigureResponse {
-            config: config.clone(),
-        })
-    };
-
-    let _server_handle = nh
-        .advertise_service::<dynamic_reconfigure::Reconfigure, _>(&full_server_name, server_fn)
-        .await.expect("can't connect to {full_server_name}");
-    tracing::info!("serving dynamic reconfigure server on {full_server_name}");
+    let server = Server::new(&nh, full_node_name, store).await?;
 
     // Setup a task to kill this process when ctrl_c comes in:
     tokio::spawn(async move {
@@ -144,23 +66,9 @@ async fn main() -> Result<(), anyhow::Error> {
         std::process::exit(0);
     });
 
-    tokio::time::sleep(tokio::time::Duration::from_secs(2)).await;
-    let _ = description_pub.publish(&config_description).await;
-
+    let mut updates = server.subscribe();
     loop {
-        // let config_state = config_state.lock().unwrap().clone();
-        // tracing::info!("Current value of config: {config_state:?}");
-        {
-            // TODO(lucasw) can't await in the server_fn above, so doing this arc mutex - is there
-            // a better way?
-            let mut do_update_pub = do_update_pub.lock().unwrap();
-            if *do_update_pub {
-                let config = config_state.lock().unwrap().clone();
-                let _ = update_pub.publish(&config).await;
-                *do_update_pub = false;
-            }
-        }
-        // let _ = description_pub.publish(&config_description).await;
-        tokio::time::sleep(tokio::time::Duration::from_secs(2)).await;
+        updates.changed().await?;
+        tracing::info!("Current value of config: {:?}", *updates.borrow_and_update());
     }
 }
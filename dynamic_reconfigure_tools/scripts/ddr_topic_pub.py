@@ -2,23 +2,29 @@
 # Lucas Walter
 # March 2018
 # Create a ddynamic reconfigure server from a provided topic type
+#
+# ~topics is a list, each entry is either a topic name (which uses the only field
+# of ~msg_type), or a dict that maps a control onto any field of any message:
+#   topics:
+#     - out
+#     - {topic: cmd_vel, msg_type: geometry_msgs/Twist, field: linear.x, min: -2.0, max: 2.0}
+#     - {topic: cmd_vel, msg_type: geometry_msgs/Twist, field: angular.z}
+# Controls on the same topic are published together as one message.
 
 import roslib.message
 import rospy
 from ddynamic_reconfigure_python.ddynamic_reconfigure import DDynamicReconfigure
+from dynamic_reconfigure_tools.msg_fields import compile_setter
 
 
 class DDRTopics():
     def __init__(self):
-        self.config = None
+        self.values = {}
 
         self.msg_name = rospy.get_param("~msg_type", "std_msgs/Float64")
-        self.msg_class = roslib.message.get_message_class(self.msg_name)
-        rospy.loginfo("{} -> {}".format(self.msg_name, self.msg_class))
-        if self.msg_class is None:
-            raise Exception("could not load message type {}".format(self.msg_name))
+        self.msg_class = self.get_message_class(self.msg_name)
 
-        # TODO(lucasw) no per-topic min/max/defaults, just these for all of them
+        # these are used for any topic that doesn't have its own
         default_value = rospy.get_param("~default", 0.0)
         min_value = rospy.get_param("~min", -1.0)
         max_value = rospy.get_param("~max", 1.0)
@@ -26,31 +32,64 @@ class DDRTopics():
 
         self.ddr = DDynamicReconfigure("")
 
+        # topic -> publisher and the message that is reused for every publish
         self.pubs = {}
+        self.msgs = {}
+        # control name -> (topic, setter)
+        self.controls = {}
         topics = rospy.get_param("~topics", ["out"])
-        for topic in topics:
+        for entry in topics:
+            if not isinstance(entry, dict):
+                entry = {'topic': entry}
+            topic = entry['topic']
+            field = entry.get('field', None)
+            msg_name = entry.get('msg_type', self.msg_name)
+            msg_class = self.get_message_class(msg_name)
+
+            if topic not in self.pubs:
+                self.pubs[topic] = rospy.Publisher(topic, msg_class, queue_size=3, latch=True)
+                self.msgs[topic] = msg_class()
+            elif self.pubs[topic].data_class != msg_class:
+                raise Exception("{} is already a {}, can't also be {}".format(
+                                topic, self.pubs[topic].data_class._type, msg_name))
+
             # TODO(lucasw) this isn't ideal but need to pare down the names
-            name = topic.replace("/", "_").lstrip("_")[-max_len:]
-            rospy.loginfo("{} -> {}".format(topic, name))
-            self.pubs[name] = rospy.Publisher(topic, self.msg_class, queue_size=3, latch=True)
-            if type(default_value) is bool:
-                self.ddr.add_variable(name, topic, default_value)
+            full_name = topic if field is None else topic + "/" + field
+            name = entry.get('name', full_name.replace("/", "_").replace(".", "_").lstrip("_")[-max_len:])
+            if name in self.controls:
+                raise Exception("duplicate control name {} for {}".format(name, full_name))
+            rospy.loginfo("{} -> {}".format(full_name, name))
+            self.controls[name] = (topic, compile_setter(msg_class, field))
+
+            default = entry.get('default', default_value)
+            if type(default) is bool:
+                self.ddr.add_variable(name, full_name, default)
             else:
-                self.ddr.add_variable(name, topic, default_value, min_value, max_value)
+                self.ddr.add_variable(name, full_name, default,
+                                      entry.get('min', min_value), entry.get('max', max_value))
 
         self.ddr.start(self.dr_callback)
 
+    def get_message_class(self, msg_name):
+        msg_class = roslib.message.get_message_class(msg_name)
+        rospy.loginfo("{} -> {}".format(msg_name, msg_class))
+        if msg_class is None:
+            raise Exception("could not load message type {}".format(msg_name))
+        return msg_class
+
     def dr_callback(self, config, level):
-        for topic in self.pubs.keys():
-            if self.config is not None:
-                old_value = getattr(self.config, topic)
-            new_value = getattr(config, topic)
-            if self.config is None or new_value != old_value:
-                # rospy.loginfo("{} {}".format(topic, new_value))
-                # TODO(lucasw) this will only work for a few simple message types
-                self.pubs[topic].publish(self.msg_class(new_value))
-
-        self.config = config
+        changed_topics = set()
+        for name, (topic, setter) in self.controls.items():
+            new_value = config[name]
+            if name in self.values and self.values[name] == new_value:
+                continue
+            self.values[name] = new_value
+            setter(self.msgs[topic], new_value)
+            changed_topics.add(topic)
+
+        # one message per topic no matter how many of its fields changed
+        for topic in changed_topics:
+            self.pubs[topic].publish(self.msgs[topic])
         return config
 
 
@@ -15,20 +15,36 @@
 # [server name, server value name, type, level, description, default value, min, max]
 # TODO support enum and hierarchy late later
 
-import copy
 import dynamic_reconfigure
 import rospy
+import threading
 
 # from dynamic_reconfigure.parameter_generator_catkin import *
-from dynamic_reconfigure.client import Client
-from dynamic_reconfigure.server import Server
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from dynamic_reconfigure_tools import base_cfg
+from dynamic_reconfigure_tools.base_cfg import ConfigDescriptor
+from dynamic_reconfigure_tools.client_pool import ClientPool
+from dynamic_reconfigure_tools.live_server import LiveServer
+from dynamic_reconfigure_tools.param_loader import is_list_control, load_controls
 from std_msgs.msg import Empty
 
 
 class Dr2Dr():
     def __init__(self):
+        # upstream servers are updated in parallel, one merged call per server
+        self.executor = ThreadPoolExecutor(max_workers=rospy.get_param("~max_workers", 8))
+        # how many per-key service calls batching has avoided
+        self.num_updates = 0
+        self.num_round_trips = 0
+        self.round_trips_saved = 0
+        # echoes of our own writes that were recognized and not passed on,
+        # and upstream configs that were older than a write still in flight
+        self.num_local_echoes = 0
+        self.num_upstream_echoes = 0
+        self.num_stale = 0
+        self.pool = None
+        self.dr_server = None
+        self.configured = False
         wait_for_config = rospy.get_param("~wait_for_config", False)
         if wait_for_config:
             self.configured_sub = rospy.Subscriber("configured", Empty,
@@ -36,120 +52,247 @@ class Dr2Dr():
         else:
             self.config(None)
 
+    # Another 'configured' message replaces the parameters of the running server
     def config(self, msg):
+        # ignore callbacks while everything is being replaced
+        self.configured = False
+        # Per parameter sync state, guarded by sync_lock:
+        # the last value both sides agreed on (or are about to),
         self.values = {}
+        # a generation count that goes up with every change from either side,
+        self.generation = {}
+        # the value (and generation) the local server is expected to echo back
+        # after an upstream change,
+        self.expect_local = {}
+        # the value (and generation of the write) an upstream server is expected to
+        # echo back after a local change, and whether that write is still in flight
+        self.expect_upstream = {}
+        self.in_flight = {}
+        # an upstream value that came back while its write was in flight,
+        # it may be the echo of a clamped value, which is only known from the response
+        self.early_echo = {}
+        # an upstream value a local edit replaced before it reached the local server,
+        # it gets kept out of the local server when it does arrive
+        self.superseded = {}
+        self.sync_lock = threading.RLock()
         self.client = {}
         self.client_of_param = {}
+        self.server_of_param = {}
         self.server_params = {}
         self.server_value_name = {}
 
-        # print(dir(base_cfg))
-        base_cfg.all_level = 1
-        # rospy.loginfo(rospy.get_namespace())
-        all_params = rospy.get_param_names()
-        prefix = rospy.get_namespace() + "controls/"
         rospy.logdebug(rospy.get_namespace())
-        for param in all_params:
-            if param[0:len(prefix)] == prefix:
-
-                config = rospy.get_param(param)
-                param = param.replace(prefix, "")
-                rospy.logdebug(param)
-                # rospy.loginfo(config)
-                # self.server[param] = config[0]
-                server_name = config[0]
-                if server_name not in self.server_params.keys():
-                    self.server_params[server_name] = []
-                self.server_params[server_name].append(param)
-                rospy.loginfo("new param: " + server_name + " " + param + " "
-                              + str(self.server_params[server_name]))
-
-                self.server_value_name[param] = config[1]
-                base_cfg.type[param] = config[2]
-                base_cfg.level[param] = config[3]
-                description = config[4]
-                base_cfg.defaults[param] = config[5]
-                base_cfg.min[param] = config[6]
-                base_cfg.max[param] = config[7]
-
-                parameter = copy.deepcopy(base_cfg.example_parameter)
-                parameter['name'] = param
-                parameter['cconst type'] = 'const ' + base_cfg.type[param]
-                parameter['ctype'] = base_cfg.type[param]
-                parameter['type'] = base_cfg.type[param]
-                parameter['description'] = description
-                parameter['default'] = base_cfg.defaults[param]
-                parameter['min'] = base_cfg.min[param]
-                parameter['max'] = base_cfg.max[param]
-                parameter['level'] = base_cfg.level[param]
-                base_cfg.config_description['parameters'].append(parameter)
-        # TODO(lucasw) if no params are found raise a warning
+        descriptor = ConfigDescriptor()
+        controls = load_controls(is_list_control)
+        for param, config in controls.items():
+            rospy.logdebug(param)
+            # rospy.loginfo(config)
+            # self.server[param] = config[0]
+            server_name = config[0]
+            if server_name not in self.server_params.keys():
+                self.server_params[server_name] = []
+            self.server_params[server_name].append(param)
+            rospy.loginfo("new param: " + server_name + " " + param + " "
+                          + str(self.server_params[server_name]))
 
-        self.configured = False
-        self.break_feedback = False
-        self.break_feedback2 = False
+            self.server_value_name[param] = config[1]
+            descriptor.add(param, type=config[2], level=config[3], description=config[4],
+                           default=config[5], min=config[6], max=config[7])
 
-        self.base_cfg = base_cfg
-        self.dr_server = Server(base_cfg, self.dr_callback)
+        self.base_cfg = descriptor.build(all_level=1)
+        if self.dr_server is None:
+            self.dr_server = LiveServer(self.base_cfg, self.dr_callback)
+        else:
+            self.dr_server.set_type(self.base_cfg)
+        for param in controls.keys():
+            self.values[param] = self.dr_server.config[param]
+            self.generation[param] = 0
 
         rospy.loginfo(self.server_params)
         for server_name in self.server_params.keys():
-            params = self.server_params[server_name]
-            # rospy.loginfo(server_name + " " + str(params))
             self.client[server_name] = None
-            try:
-                self.client[server_name] = Client(server_name, timeout=1,
-                                                  config_callback=partial(self.upstream_dr_callback,
-                                                                          params))
-            except rospy.exceptions.ROSException as e:
-                # TODO(lucasw) if the server doesn't exist yet, retry later
-                rospy.logwarn(e)
-
-            for param in params:
+            for param in self.server_params[server_name]:
                 rospy.loginfo(param + " " + server_name)
-                self.client_of_param[param] = self.client[server_name]
+                self.client_of_param[param] = None
+                self.server_of_param[param] = server_name
+
+        # Connect to all the upstream servers in parallel, don't wait for them,
+        # each mapping is enabled once its server shows up
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.pool = ClientPool(on_connect=self.on_connect,
+                               timeout=rospy.get_param("~connect_timeout", 1.0),
+                               max_backoff=rospy.get_param("~max_retry_period", 30.0),
+                               max_workers=rospy.get_param("~max_connect_workers", 16))
+        for server_name in self.server_params.keys():
+            params = self.server_params[server_name]
+            self.pool.add(server_name, config_callback=partial(self.upstream_dr_callback, params))
         self.configured = True
 
+    def on_connect(self, server_name, client):
+        self.client[server_name] = client
+        for param in self.server_params[server_name]:
+            self.client_of_param[param] = client
+
     # the callback from this server update the other servers through the clients
     def dr_callback(self, config, level):
-        # print(level, config, self.configured, self.break_feedback)
+        # print(level, config, self.configured)
         if not self.configured:
             return config
-        if self.break_feedback:
-            return config
-        for key in config.groups.parameters.keys():
-            if level & self.base_cfg.level[key]:
-                server_key_name = self.server_value_name[key]
+        # gather the changes into one update per upstream server
+        server_updates = {}
+        # param -> generation of the value being written upstream
+        written = {}
+        with self.sync_lock:
+            for key in self.server_value_name.keys():
                 value = config[key]
-                # TODO(lucasw) conglomerate updates from the same server
-                if self.client_of_param[key]:
-                    self.break_feedback2 = True
-                    try:
-                        self.client_of_param[key].update_configuration({server_key_name: value})
-                    except dynamic_reconfigure.DynamicReconfigureParameterException as e:
-                        rospy.loginfo(str(level) + " " + key + ": " + str(value))
-                        rospy.logwarn(e)
-                    self.break_feedback2 = False
-                # TODO(lucasw) else try creating the client again- or
-                # have timered update that tries that at regular rate?
+                # what the local server has before this change
+                previous = self.dr_server.config[key]
+                if key in self.expect_local:
+                    expected, generation = self.expect_local[key]
+                    if expected == value:
+                        # this is the local server reporting back a value that came from upstream
+                        del self.expect_local[key]
+                        self.num_local_echoes += 1
+                        continue
+                    if value == previous:
+                        # a config from before the upstream value was applied,
+                        # with changes to other params only
+                        self.num_stale += 1
+                        continue
+                    # edited locally while the upstream value was on its way,
+                    # the edit is newer so it goes upstream and replaces the upstream value
+                    del self.expect_local[key]
+                    self.superseded[key] = expected
+                elif key in self.superseded:
+                    if value == self.superseded.pop(key) and value != previous:
+                        # the replaced upstream value arriving, keep the local edit
+                        config[key] = previous
+                        continue
+                if value == self.values[key]:
+                    continue
+                # the client pool is still trying to reach this server
+                if not self.client_of_param[key]:
+                    continue
+                self.values[key] = value
+                self.generation[key] += 1
+                self.expect_upstream[key] = (value, self.generation[key])
+                self.in_flight[key] = self.generation[key]
+                written[key] = self.generation[key]
+                server_name = self.server_of_param[key]
+                if server_name not in server_updates:
+                    server_updates[server_name] = {}
+                server_updates[server_name][self.server_value_name[key]] = value
+        if not server_updates:
+            return config
+
+        # wait for these so updates to the same server stay in order
+        futures = []
+        for server_name, updates in server_updates.items():
+            futures.append(self.executor.submit(self.update_server, server_name, updates, level))
+        clamped = {}
+        for future in futures:
+            clamped.update(future.result())
+
+        with self.sync_lock:
+            for key, generation in written.items():
+                if self.in_flight.get(key) == generation:
+                    del self.in_flight[key]
+            # The upstream server didn't take these values, show what it has instead.
+            # This can't call update_configuration on the local server from inside
+            # its own callback, but the returned config becomes the local config.
+            for key, value in clamped.items():
+                if self.generation[key] == written[key]:
+                    self.values[key] = value
+                    config[key] = value
+
+        num_updates = sum([len(updates) for updates in server_updates.values()])
+        self.num_updates += num_updates
+        self.num_round_trips += len(server_updates)
+        self.round_trips_saved += num_updates - len(server_updates)
+        rospy.logdebug(("{} updates in {} calls, {} round trips saved so far, "
+                        + "echoes suppressed: {} local {} upstream, {} stale").format(
+                       num_updates, len(server_updates), self.round_trips_saved,
+                       self.num_local_echoes, self.num_upstream_echoes, self.num_stale))
         return config
 
+    # returns param -> value for the values the server clamped
+    def update_server(self, server_name, updates, level):
+        clamped = {}
+        try:
+            response = self.client[server_name].update_configuration(updates)
+        except (dynamic_reconfigure.DynamicReconfigureParameterException,
+                rospy.ServiceException) as e:
+            rospy.loginfo(str(level) + " " + server_name + ": " + str(updates))
+            rospy.logwarn(e)
+            return clamped
+        if response is None:
+            return clamped
+        # the server may have clamped the values, expect those to come back instead
+        with self.sync_lock:
+            for param in self.server_params[server_name]:
+                server_key_name = self.server_value_name[param]
+                if server_key_name not in updates or server_key_name not in response:
+                    continue
+                value = response[server_key_name]
+                if value != updates[server_key_name]:
+                    clamped[param] = value
+                if param not in self.expect_upstream:
+                    continue
+                expected, generation = self.expect_upstream[param]
+                if self.early_echo.pop(param, None) == (value, generation):
+                    # the echo already came, before the response
+                    del self.expect_upstream[param]
+                    self.num_upstream_echoes += 1
+                    continue
+                self.expect_upstream[param] = (value, generation)
+        return clamped
+
     # the callback from the all the upstream servers updates the local server
     # TODO(lucasw) thought config would come before params from partial,
     # but that is not the case.
     def upstream_dr_callback(self, params, config):
-        if self.break_feedback2:
-            return
         # rospy.loginfo('config: ' + str(config))
         # rospy.loginfo('params: ' + str(params))
         updates = {}
-        for param in params:
-            updates[param] = config[self.server_value_name[param]]
+        with self.sync_lock:
+            for param in params:
+                value = config[self.server_value_name[param]]
+                if param in self.expect_upstream:
+                    expected, generation = self.expect_upstream[param]
+                    if value == expected:
+                        # our own write coming back
+                        del self.expect_upstream[param]
+                        self.num_upstream_echoes += 1
+                        continue
+                    if self.in_flight.get(param) == generation:
+                        # published before the upstream server got our write,
+                        # or the echo of a value it clamped, update_server sorts out which
+                        self.early_echo[param] = (value, generation)
+                        self.num_stale += 1
+                        continue
+                    # the write finished but the server has moved on since
+                    del self.expect_upstream[param]
+                if value == self.values[param]:
+                    continue
+                self.values[param] = value
+                self.generation[param] += 1
+                self.expect_local[param] = (value, self.generation[param])
+                updates[param] = (value, self.generation[param])
+        if not updates:
+            return
         # rospy.loginfo(updates)
         # Update the local values, which will in turn trigger dr_callback
-        self.break_feedback = True
-        self.dr_server.update_configuration(updates)
-        self.break_feedback = False
+        # which will recognize them as coming from upstream
+        config = self.dr_server.update_configuration(dict([(param, value) for param, (value, _)
+                                                           in updates.items()]))
+        with self.sync_lock:
+            for param, (value, generation) in updates.items():
+                if self.expect_local.get(param) == (value, generation):
+                    # the local server clamped it, keep what it has
+                    del self.expect_local[param]
+                    if self.generation[param] == generation:
+                        self.values[param] = config[param]
         # http://wiki.ros.org/dynamic_reconfigure/Tutorials/UsingTheDynamicReconfigurePythonClient
 
 
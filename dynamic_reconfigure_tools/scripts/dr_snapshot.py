@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# Lucas Walter
+# Take snapshots of the configs of many dynamic reconfigure servers at once
+# and restore them later.
+#
+# rosrun dynamic_reconfigure_tools dr_snapshot.py _file:=tuning.json
+# rostopic pub -1 /dr_snapshot/save std_msgs/String "before"
+# rostopic pub -1 /dr_snapshot/diff std_msgs/String "before current"
+# rostopic pub -1 /dr_snapshot/restore std_msgs/String "before"
+#
+# The latest config of every server comes from its parameter_updates through
+# the client, so a snapshot is the state of all the servers at the time of saving.
+# A restore only sends the keys that differ from the current configs,
+# with one call per server and all the servers in parallel.
+# The results go out on ~report as yaml.
+
+import dynamic_reconfigure
+import rospy
+import threading
+import yaml
+
+from concurrent.futures import ThreadPoolExecutor
+from dynamic_reconfigure_tools.client_pool import ClientPool
+from dynamic_reconfigure_tools.snapshot_store import config_delta, diff_configs, SnapshotStore
+from functools import partial
+from std_msgs.msg import String
+
+
+class DrSnapshot():
+    def __init__(self):
+        self.lock = threading.Lock()
+        # server name -> latest config
+        self.latest = {}
+        self.store = SnapshotStore(rospy.get_param("~file", None))
+        # servers that applied a restore get their old values back
+        # if any server failed or rejected part of it
+        self.rollback = rospy.get_param("~rollback", True)
+        self.executor = ThreadPoolExecutor(max_workers=rospy.get_param("~max_workers", 16))
+        self.pool = ClientPool(timeout=rospy.get_param("~connect_timeout", 1.0),
+                               max_workers=rospy.get_param("~max_connect_workers", 16))
+        # only these servers, or all of them if empty
+        self.servers = rospy.get_param("~servers", [])
+        self.add_servers()
+
+        self.report_pub = rospy.Publisher("~report", String, queue_size=4)
+        self.save_sub = rospy.Subscriber("~save", String, self.save, queue_size=4)
+        self.diff_sub = rospy.Subscriber("~diff", String, self.diff, queue_size=4)
+        self.restore_sub = rospy.Subscriber("~restore", String, self.restore, queue_size=1)
+
+    # servers that have appeared since the last time are picked up
+    # on the next save or restore
+    def add_servers(self):
+        servers = self.servers
+        if not servers:
+            servers = dynamic_reconfigure.find_reconfigure_services()
+        for server in servers:
+            self.pool.add(server, config_callback=partial(self.config_callback, server))
+
+    def config_callback(self, server, config):
+        config = dict(config)
+        config.pop('groups', None)
+        with self.lock:
+            self.latest[server] = config
+
+    def current(self):
+        with self.lock:
+            return dict(self.latest)
+
+    def publish_report(self, report):
+        text = yaml.safe_dump(report, default_flow_style=False)
+        rospy.loginfo(text)
+        self.report_pub.publish(String(text))
+
+    def save(self, msg):
+        name = msg.data.strip() or None
+        configs = self.current()
+        snapshot_id = self.store.record(configs, name=name)
+        if self.store.path is not None:
+            self.store.save()
+        self.publish_report({'saved': snapshot_id, 'name': name, 'servers': sorted(configs.keys())})
+        self.add_servers()
+
+    # 'a b' diffs two snapshots, 'a' or 'a current' diffs a snapshot with the current configs
+    def diff(self, msg):
+        names = msg.data.split()
+        try:
+            if len(names) == 2 and names[1] != 'current':
+                diff = self.store.diff(names[0], names[1])
+            else:
+                diff = diff_configs(self.store.get(names[0]), self.current())
+        except (IndexError, KeyError) as e:
+            rospy.logwarn("can't diff '{}': {}".format(msg.data, e))
+            return
+        report = {}
+        for server, server_diff in diff.items():
+            report[server] = dict([(key, list(values)) for key, values in server_diff.items()])
+        self.publish_report({'diff': report})
+
+    def restore(self, msg):
+        name = msg.data.strip()
+        try:
+            target = self.store.get(name)
+        except KeyError as e:
+            rospy.logwarn(e)
+            return
+        current = self.current()
+        delta = config_delta(current, target)
+        report = self.send(delta)
+        report['restored'] = name
+        report['unchanged'] = sorted([server for server in target.keys() if server not in delta])
+
+        if self.rollback and (report['failed'] or report['rejected']):
+            # put back what was there before on the servers that took any of it
+            changed = report['applied'] + list(report['rejected'].keys())
+            undo = {}
+            for server in changed:
+                previous = current.get(server, {})
+                undo[server] = dict([(key, previous[key]) for key in delta[server] if key in previous])
+            undo_report = self.send(undo)
+            report['rolled_back'] = undo_report['applied']
+            report['rollback_failed'] = dict(list(undo_report['failed'].items())
+                                             + list(undo_report['rejected'].items()))
+        self.publish_report(report)
+        self.add_servers()
+
+    # one call per server, all servers in parallel
+    def send(self, delta):
+        futures = dict([(server, self.executor.submit(self.update_server, server, changes))
+                        for server, changes in delta.items() if changes])
+        report = {'applied': [], 'rejected': {}, 'failed': {}}
+        for server in sorted(futures.keys()):
+            error, rejected = futures[server].result()
+            if error is not None:
+                report['failed'][server] = error
+            elif rejected:
+                report['rejected'][server] = rejected
+            else:
+                report['applied'].append(server)
+        return report
+
+    # returns an error, or the keys the server didn't set to the requested value
+    def update_server(self, server, changes):
+        client = self.pool.get(server)
+        if client is None:
+            return "not connected", None
+        try:
+            config = client.update_configuration(changes)
+        except (dynamic_reconfigure.DynamicReconfigureParameterException,
+                rospy.ServiceException) as e:
+            return str(e), None
+        if config is None:
+            return "no response", None
+        rejected = sorted([key for key, value in changes.items() if config.get(key) != value])
+        return None, rejected
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.pool.shutdown()
+
+
+if __name__ == "__main__":
+    rospy.init_node("dr_snapshot")
+    dr_snapshot = DrSnapshot()
+    rospy.on_shutdown(dr_snapshot.shutdown)
+    rospy.spin()
@@ -2,16 +2,26 @@
 # Lucas Walter
 # March 2018
 # Create a dynamic reconfigure server dynamically from a provided topic type
+#
+# Each control is published on its topic at a fixed rate with the current
+# config value, all topics are driven from one scheduler thread:
+#   controls:
+#     gain: {name: gain, topic: gain, type: double, min: 0.0, max: 10.0, rate: 50.0}
+#     speed: {name: speed, topic: cmd_vel, type: double, min: -1.0, max: 1.0,
+#             msg_type: geometry_msgs/Twist, field: linear.x}
+# msg_type defaults to ~msg_type, field defaults to the only field of the message,
+# rate defaults to 1 / ~dt (a rate of 0 only publishes on change).
+# Controls on the same topic share one message, published at the highest of their rates.
 
-import copy
 import roslib.message
 import rospy
+import threading
 
-from dynamic_reconfigure.server import Server
-from dynamic_reconfigure_tools import base_cfg
+from dynamic_reconfigure_tools.msg_fields import compile_setter
+from dynamic_reconfigure_tools.msg_server import MsgServer
+from dynamic_reconfigure_tools.param_loader import is_dict_control, load_controls
+from dynamic_reconfigure_tools.scheduler import PeriodicScheduler
 from std_msgs.msg import Empty
-# from std_msgs.msg import Float64
-# from std_msgs.msg import Int32
 
 
 class DrTopics():
@@ -19,7 +29,23 @@ class DrTopics():
         self.dr_server = None
 
         self.msg_name = rospy.get_param("~msg_type", "std_msgs/Float32")
-        self.pub = None
+        self.dt = rospy.get_param("~dt", 1.0)
+        self.publish_on_change = rospy.get_param("~publish_on_change", True)
+        rospy.loginfo(f"{self.msg_name}, update at {self.dt}s")
+
+        # guards the messages, which are filled in by dr_callback
+        # and published from the scheduler thread
+        self.lock = threading.Lock()
+        self.config_lock = threading.Lock()
+        # topic -> publisher, the message reused for every publish, and its rate
+        self.pubs = {}
+        self.msgs = {}
+        self.rates = {}
+        # control param -> (topic, setter)
+        self.controls = {}
+        self.scheduler = PeriodicScheduler()
+        rospy.on_shutdown(self.scheduler.shutdown)
+
         self.configured_sub = rospy.Subscriber("configured", Empty,
                                                self.config, queue_size=1)
         # TODO(lucasw) this might run concurrently with callback,
@@ -27,116 +53,117 @@ class DrTopics():
         # if rospy.get_param("~config_on_init", False):
         #    self.config()
 
-        self.dt = rospy.get_param("~dt", 1.0)
-        self.msg_class = None
-        self.timer = None
-        self.make_pub()
-
-    def make_pub(self):
-        self.msg_class = roslib.message.get_message_class(self.msg_name)
-        rospy.loginfo(f"{self.msg_name} {self.msg_class}, update at {self.dt}s")
-
-    def dont_use(self):
-        self.msg_class = roslib.message.get_message_class(self.msg_name)
-        all_fields = dir(self.msg_class)
-        # generic_fields = dir(rospy.Message)
-        # generic_fields = dir(rospy.AnyMsg)
-        generic_fields = dir(Empty)
-
-        fields = []
-        for field in all_fields:
-            if field not in generic_fields:
-                fields.append(field)
-        print(fields)
-        # TODO look in rqt message publisher
-        for field in fields:
-            print(field, ": ", dir(getattr(self.msg_class(), field)))
-        if self.pub:
-            self.pub.unregister()
-        self.pub = rospy.Publisher("output", self.msg_class, queue_size=5)
-        self.timer = rospy.Timer(rospy.Duration(self.dt), self.update)
-
-    def update(self, event):
-        msg = self.msg_class()
-        self.pub.publish(msg)
+    def get_message_class(self, msg_name):
+        msg_class = roslib.message.get_message_class(msg_name)
+        if msg_class is None:
+            raise Exception("could not load message type {}".format(msg_name))
+        return msg_class
+
+    def publish(self, topic):
+        with self.lock:
+            if topic in self.pubs:
+                self.pubs[topic].publish(self.msgs[topic])
 
     def config(self, msg=None):
-        self.values = {}
-        self.parameters = {}
-
-        # print(dir(base_cfg))
-        base_cfg.all_level = 1
-        # rospy.loginfo(rospy.get_namespace())
-        all_params = rospy.get_param_names()
-        prefix = rospy.get_namespace() + "controls/"
+        with self.config_lock:
+            self.config_inner()
+
+    def config_inner(self):
         # prefix_feedback = rospy.get_namespace() + "feedback/"
         rospy.loginfo(rospy.get_namespace())
-        level_shift = 0
-        for param in all_params:
-            if param[0:len(prefix)] == prefix:
-                if param[-len("/name"):] == "/name":
-                    # TODO(lucasw) this is more readable than 'param',
-                    # but might contain illegal characters
-                    name = rospy.get_param(param)
-                    param = param.replace(prefix, "")
-                    param = param.replace("/name", "")
-                    # topic = rospy.get_param(prefix + param + "/topic")
-                    base_cfg.min[param] = rospy.get_param(prefix + param + "/min")
-                    base_cfg.max[param] = rospy.get_param(prefix + param + "/max")
-                    # TODO(lucasw) set the default somewhere
-                    print(f"{name}: {prefix}{param}/default")
-                    default = rospy.get_param(prefix + param + "/default", base_cfg.min[param])
-                    base_cfg.defaults[param] = default
-                    self.values[param] = base_cfg.defaults[param]
-
-                    base_type = rospy.get_param(prefix + param + "/type")
-                    if base_type == 'menu' or base_type == 'button':
-                        base_type = 'int'
-                    base_cfg.type[param] = base_type
-                    base_cfg.level[param] = 1 << (level_shift % 32)
-                    level_shift += 1
-                    # rospy.loginfo(param + " " + str(minimum) + " " +
-                    #               str(maximum) + " " + str(ctrl_type))
-                    parameter = copy.deepcopy(base_cfg.example_parameter)
-                    parameter['name'] = param
-                    parameter['cconst type'] = 'const ' + base_type
-                    parameter['ctype'] = base_type
-                    parameter['type'] = base_type
-                    parameter['min'] = base_cfg.min[param]
-                    parameter['max'] = base_cfg.max[param]
-                    parameter['level'] = base_cfg.level[param]
-                    self.parameters[param] = parameter
-                    base_cfg.config_description['parameters'].append(parameter)
-                    # TODO(lucasw) use Float64, Int32 as types
-                    if base_type == 'int':
-                        pass
-                    elif base_type == 'double':
-                        pass
-        # TODO(lucasw) if no params are found raise a warning
-
-        self.base_cfg = base_cfg
-
-        # TODO(lucasw) if dr_server is already running from previous
-        # init, how to stop it?
-        self.dr_server = Server(base_cfg, self.dr_callback)
-
-    def dr_callback(self, config, level):
-        for key in config.groups.parameters.keys():
-            if level & self.base_cfg.level[key]:
-                if self.parameters[key]['type'] == 'int':
-                    pass
-                    # self.pubs[key].publish(Int32(config[key]))
-                elif self.parameters[key]['type'] == 'double':
-                    pass
-                    # self.pubs[key].publish(Float64(config[key]))
-        return config
-
-    def feedback_callback(self, msg, param):
-        self.values[param] = msg.data
-        # dict update the dr server
-        delta = {}
-        delta[param] = msg.data
-        self.dr_server.update_configuration(delta)
+        if self.dr_server is None:
+            self.dr_server = MsgServer(None, self.dr_callback)
+        params = {}
+        pubs = {}
+        msgs = {}
+        rates = {}
+        controls = {}
+        for param, control in load_controls(is_dict_control).items():
+            # TODO(lucasw) this is more readable than 'param',
+            # but might contain illegal characters
+            name = control['name']
+            topic = control['topic']
+            minimum = control['min']
+            maximum = control['max']
+            # TODO(lucasw) set the default somewhere
+            print(f"{name}: {param}/default")
+            default = control.get('default', minimum)
+
+            base_type = control['type']
+            if base_type == 'menu' or base_type == 'button':
+                base_type = 'int'
+            # rospy.loginfo(param + " " + str(minimum) + " " +
+            #               str(maximum) + " " + str(ctrl_type))
+            params[param] = dict(type=base_type, default=default,
+                                 min=minimum, max=maximum, level=1, description=name)
+
+            msg_name = control.get('msg_type', self.msg_name)
+            msg_class = self.get_message_class(msg_name)
+            if topic not in pubs:
+                pubs[topic] = rospy.Publisher(topic, msg_class, queue_size=5)
+                msgs[topic] = msg_class()
+                rates[topic] = 0.0
+            elif pubs[topic].data_class != msg_class:
+                raise Exception("{} is already a {}, can't also be {}".format(
+                                topic, pubs[topic].data_class._type, msg_name))
+            rate = control.get('rate', 1.0 / self.dt if self.dt > 0.0 else 0.0)
+            rates[topic] = max(rates[topic], rate)
+            controls[param] = (topic, compile_setter(msg_class, control.get('field', None)))
+
+        # replace everything from any previous config
+        self.scheduler.clear()
+        with self.lock:
+            for pub in self.pubs.values():
+                pub.unregister()
+            self.pubs = pubs
+            self.msgs = msgs
+            self.rates = rates
+            self.controls = controls
+
+        # only the params that changed go into the new description
+        values = {}
+        with self.dr_server.batch():
+            for param in list(self.dr_server.types.keys()):
+                if param not in params:
+                    self.dr_server.remove_param(param)
+            for param, kwargs in params.items():
+                values[param] = self.dr_server.add_param(param, **kwargs)
+
+        # the messages are new so they need every value,
+        # the server only calls back with changes
+        with self.lock:
+            for param, value in values.items():
+                topic, setter = self.controls[param]
+                setter(self.msgs[topic], value)
+            if self.publish_on_change:
+                for topic in self.pubs.keys():
+                    self.pubs[topic].publish(self.msgs[topic])
+
+        # spread the first publishes out over a period so topics
+        # with the same rate don't all go out at once
+        for i, topic in enumerate(sorted(rates.keys())):
+            if rates[topic] <= 0.0:
+                continue
+            period = 1.0 / rates[topic]
+            self.scheduler.add(topic, period, lambda topic=topic: self.publish(topic),
+                               delay=period * i / len(rates))
+        rospy.loginfo("{} controls on {} topics, {} published periodically".format(
+                      len(controls), len(pubs), len(self.scheduler)))
+
+    # only gets the controls that changed
+    def dr_callback(self, changes, level):
+        with self.lock:
+            changed_topics = set()
+            for key, value in changes.items():
+                if key not in self.controls:
+                    continue
+                topic, setter = self.controls[key]
+                setter(self.msgs[topic], value)
+                changed_topics.add(topic)
+            if self.publish_on_change:
+                for topic in changed_topics:
+                    self.pubs[topic].publish(self.msgs[topic])
+        return changes
 
 
 if __name__ == "__main__":
@@ -6,19 +6,36 @@
 # For v4l2ucp it would be nice to be able to do this in C++
 # or alternatively do the v4l2 calls in python.
 
-import copy
 import rospy
+import threading
 
-from dynamic_reconfigure.server import Server
-from dynamic_reconfigure_tools import base_cfg
+from dynamic_reconfigure_tools.coalescer import DeltaCoalescer
+from dynamic_reconfigure_tools.msg_server import MsgServer
+from dynamic_reconfigure_tools.param_loader import is_dict_control, load_controls
 from std_msgs.msg import Empty, Float64, Int32
 
+msg_types = {
+    'int': Int32,
+    'double': Float64,
+}
+
 
 class DrTopics():
     def __init__(self):
         self.dr_server = None
-        self.delta = None
-        self.timer = rospy.Timer(rospy.Duration(0.1), self.update)
+        self.config_lock = threading.Lock()
+        # control param -> (publisher, message class)
+        self.pubs = {}
+        self.subs = {}
+        self.values = {}
+        # control param -> (topic, type) it is currently hooked up to
+        self.topics = {}
+        # feedback from all the topics is merged and pushed into the server
+        # at most ~feedback_rate times a second
+        self.feedback = DeltaCoalescer(self.update,
+                                       max_rate=rospy.get_param("~feedback_rate", 10.0),
+                                       settle=rospy.get_param("~feedback_settle", 0.02))
+        rospy.on_shutdown(self.feedback.shutdown)
         self.configured_sub = rospy.Subscriber("configured", Empty,
                                                self.config, queue_size=1)
         # TODO(lucasw) this might run concurrently with callback,
@@ -27,101 +44,101 @@ class DrTopics():
         #    self.config()
 
     def config(self, msg=None):
-        self.pubs = {}
-        self.subs = {}
-        self.values = {}
-        self.parameters = {}
+        with self.config_lock:
+            self.config_inner()
 
-        # print(dir(base_cfg))
-        base_cfg.all_level = 1
-        # rospy.loginfo(rospy.get_namespace())
+    # Calling this again (another 'configured' message) reuses the running
+    # server and only creates or removes the publishers and subscribers
+    # for the controls that were added, removed or changed.
+    # All the parameter changes go out to clients as one new description.
+    def config_inner(self):
         # TODO(lucasw) maybe this should be a pickled string instead
         # of a bunch of params?
-        all_params = rospy.get_param_names()
-        prefix = rospy.get_namespace() + "controls/"
-        prefix_feedback = rospy.get_namespace() + "feedback/"
         rospy.loginfo(rospy.get_namespace())
-        level_shift = 0
-        for param in all_params:
-            if param[0:len(prefix)] == prefix:
-                if param[-len("/name"):] == "/name":
-                    # TODO(lucasw) this is more readable than 'param',
-                    # but might contain illegal characters
-                    name = rospy.get_param(param)
-                    param = param.replace(prefix, "")
-                    param = param.replace("/name", "")
-                    topic = rospy.get_param(prefix + param + "/topic")
-                    base_cfg.min[param] = rospy.get_param(prefix + param + "/min")
-                    base_cfg.max[param] = rospy.get_param(prefix + param + "/max")
-                    # TODO(lucasw) set the default somewhere
-                    print(name, ':', prefix + param + "/default")
-                    default = rospy.get_param(prefix + param + "/default", base_cfg.min[param])
-                    base_cfg.defaults[param] = default
-                    self.values[param] = base_cfg.defaults[param]
-
-                    base_type = rospy.get_param(prefix + param + "/type")
-                    if base_type == 'menu' or base_type == 'button':
-                        base_type = 'int'
-                    base_cfg.type[param] = base_type
-                    base_cfg.level[param] = 1 << (level_shift % 32)
-                    level_shift += 1
-                    # rospy.loginfo(param + " " + str(minimum) + " " +
-                    #               str(maximum) + " " + str(ctrl_type))
-                    parameter = copy.deepcopy(base_cfg.example_parameter)
-                    parameter['name'] = param
-                    parameter['cconst type'] = 'const ' + base_type
-                    parameter['ctype'] = base_type
-                    parameter['type'] = base_type
-                    parameter['min'] = base_cfg.min[param]
-                    parameter['max'] = base_cfg.max[param]
-                    parameter['level'] = base_cfg.level[param]
-                    self.parameters[param] = parameter
-                    base_cfg.config_description['parameters'].append(parameter)
-                    # TODO(lucasw) use Float64, Int32 as types
-                    if base_type == 'int':
-                        self.pubs[param] = rospy.Publisher(topic,
-                                                           Int32, queue_size=2)
-                    elif base_type == 'double':
-                        self.pubs[param] = rospy.Publisher(topic,
-                                                           Float64, queue_size=2)
-        # TODO(lucasw) if no params are found raise a warning
-
-        self.base_cfg = base_cfg
-
-        # TODO(lucasw) if dr_server is already running from previous
-        # init, how to stop it?
-        self.dr_server = Server(base_cfg, self.dr_callback)
-
-        # can't create subscribers until dr server is running
-        for param in self.values.keys():
-            if self.parameters[param]['type'] == 'int':
-                self.subs[param] = rospy.Subscriber(prefix_feedback + param,
-                                                    Int32, self.feedback_callback,
-                                                    param, queue_size=2)
-            elif self.parameters[param]['type'] == 'double':
-                self.subs[param] = rospy.Subscriber(prefix_feedback + param,
-                                                    Float64, self.feedback_callback,
-                                                    param, queue_size=2)
-
-    def dr_callback(self, config, level):
-        for key in config.groups.parameters.keys():
-            if level & self.base_cfg.level[key]:
-                if self.parameters[key]['type'] == 'int':
-                    self.pubs[key].publish(Int32(config[key]))
-                elif self.parameters[key]['type'] == 'double':
-                    self.pubs[key].publish(Float64(config[key]))
-        return config
+        if self.dr_server is None:
+            self.dr_server = MsgServer(None, self.dr_callback)
+        params = {}
+        topics = {}
+        controls = load_controls(is_dict_control)
+        for param, control in controls.items():
+            # TODO(lucasw) this is more readable than 'param',
+            # but might contain illegal characters
+            name = control['name']
+            minimum = control['min']
+            maximum = control['max']
+            # TODO(lucasw) set the default somewhere
+            print(name, ':', param + "/default")
+            default = control.get('default', minimum)
+            if param not in self.values:
+                self.values[param] = default
+
+            base_type = control['type']
+            if base_type == 'menu' or base_type == 'button':
+                base_type = 'int'
+            # rospy.loginfo(param + " " + str(minimum) + " " +
+            #               str(maximum) + " " + str(ctrl_type))
+            params[param] = dict(type=base_type, default=default,
+                                 min=minimum, max=maximum, level=1, description=name)
+            topics[param] = (control['topic'], base_type)
+
+        removed = [param for param in self.topics if self.topics[param] != topics.get(param)]
+        added = [param for param in topics if topics[param] != self.topics.get(param)]
+        rospy.loginfo("{} controls, {} added, {} removed".format(len(topics), len(added), len(removed)))
+
+        for param in removed:
+            if param in self.pubs:
+                self.pubs.pop(param)[0].unregister()
+            sub = self.subs.pop(param, None)
+            if sub is not None:
+                sub.unregister()
+            if param not in topics:
+                self.values.pop(param, None)
+        for param in added:
+            topic, base_type = topics[param]
+            if base_type not in msg_types:
+                continue
+            msg_class = msg_types[base_type]
+            self.pubs[param] = (rospy.Publisher(topic, msg_class, queue_size=2), msg_class)
+        self.topics = topics
+
+        with self.dr_server.batch():
+            for param in list(self.dr_server.types.keys()):
+                if param not in params:
+                    self.dr_server.remove_param(param)
+            for param, kwargs in params.items():
+                value = self.dr_server.add_param(param, **kwargs)
+                # the server doesn't call back with the values of new params
+                if param in added and param in self.pubs:
+                    pub, msg_class = self.pubs[param]
+                    pub.publish(msg_class(value))
+
+        # can't create subscribers until dr server has the params
+        prefix_feedback = rospy.get_namespace() + "feedback/"
+        for param in added:
+            if param not in self.pubs:
+                continue
+            self.subs[param] = rospy.Subscriber(prefix_feedback + param,
+                                                self.pubs[param][1], self.feedback_callback,
+                                                param, queue_size=2)
+
+    # only gets the controls that changed
+    def dr_callback(self, changes, level):
+        for key, value in changes.items():
+            if key in self.pubs:
+                pub, msg_class = self.pubs[key]
+                pub.publish(msg_class(value))
+        return changes
 
     def feedback_callback(self, msg, param):
         self.values[param] = msg.data
-        # dict update the dr server
-        self.delta = {}
-        self.delta[param] = msg.data
-
-    def update(self, evt):
-        if self.delta:
-            self.dr_server.update_configuration(self.delta)
-            self.delta = None
+        self.feedback.add(param, msg.data)
+
+    def update(self, delta):
+        # a control may have been removed since its feedback arrived
+        delta = {key: value for key, value in delta.items() if key in self.topics}
+        if delta:
+            self.dr_server.update_configuration(delta)
+        rospy.logdebug("feedback {}".format(self.feedback.stats()))
 
 
 if __name__ == "__main__":
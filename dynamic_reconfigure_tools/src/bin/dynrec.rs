@@ -1,20 +1,232 @@
 /// call a dynamic reconfigure server from the command line
+///
+///   dynrec server_name param value
+///   dynrec dump [file.yaml] [_jobs:=16]
+///   dynrec load file.yaml [_jobs:=16]
+///
+/// dump saves the config of every server found on the master from its latched
+/// parameter_updates, without calling set_parameters (which would run the reconfigure
+/// callback on every node), load sets every server in the file with one set_parameters
+/// call each, up to _jobs servers at a time.
 
-use std::collections::HashMap;
+use dynamic_reconfigure_tools::dynamic_reconfigure;
+use dynamic_reconfigure_tools::param_store::{config_values, values_config, Value};
+use roslibrust::ros1::{MasterClient, NodeHandle};
+use std::collections::{BTreeMap, HashMap};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
+use tokio::sync::Semaphore;
 use tracing_subscriber;
 
-roslibrust_codegen_macro::find_and_generate_ros_messages!();
+// server name -> param name -> value
+type ServerValues = BTreeMap<String, BTreeMap<String, Value>>;
+
+// a server that doesn't answer in this time is counted as failed
+const CALL_TIMEOUT: Duration = Duration::from_secs(5);
+
+struct Outcome {
+    server: String,
+    elapsed: Duration,
+    result: Result<dynamic_reconfigure::Config, anyhow::Error>,
+}
+
+// the latest config from the latched parameter_updates
+async fn get_config(
+    nh: &NodeHandle,
+    server: &str,
+) -> Result<dynamic_reconfigure::Config, anyhow::Error> {
+    let topic = format!("{server}/parameter_updates");
+    let mut subscriber = nh
+        .subscribe::<dynamic_reconfigure::Config>(&topic, 1)
+        .await
+        .map_err(|err| anyhow::anyhow!("can't subscribe to {topic} {err:?}"))?;
+    match subscriber.next().await {
+        Some(Ok(config)) => Ok(config),
+        Some(Err(err)) => Err(anyhow::anyhow!("{topic} {err:?}")),
+        None => Err(anyhow::anyhow!("{topic} closed")),
+    }
+}
+
+async fn set_config(
+    nh: &NodeHandle,
+    server: &str,
+    request: &dynamic_reconfigure::ReconfigureRequest,
+) -> Result<dynamic_reconfigure::Config, anyhow::Error> {
+    let service_name = format!("{server}/set_parameters");
+    let client = nh
+        .service_client::<dynamic_reconfigure::Reconfigure>(&service_name)
+        .await
+        .map_err(|err| anyhow::anyhow!("can't connect to {service_name} {err:?}"))?;
+    let response = client.call(request).await?;
+    Ok(response.config)
+}
+
+// get the config with no request, or set it
+async fn call_server(
+    nh: NodeHandle,
+    server: String,
+    request: Option<dynamic_reconfigure::ReconfigureRequest>,
+) -> Outcome {
+    let t0 = Instant::now();
+    let call = async {
+        match &request {
+            None => get_config(&nh, &server).await,
+            Some(request) => set_config(&nh, &server, request).await,
+        }
+    };
+    let result = match tokio::time::timeout(CALL_TIMEOUT, call).await {
+        Ok(result) => result,
+        Err(_) => Err(anyhow::anyhow!("timed out after {CALL_TIMEOUT:?}")),
+    };
+    Outcome {
+        server,
+        elapsed: t0.elapsed(),
+        result,
+    }
+}
+
+// one call per server, at most jobs of them in progress at once
+async fn call_servers(
+    nh: &NodeHandle,
+    requests: Vec<(String, Option<dynamic_reconfigure::ReconfigureRequest>)>,
+    jobs: usize,
+) -> Result<Vec<Outcome>, anyhow::Error> {
+    let semaphore = Arc::new(Semaphore::new(jobs.max(1)));
+    let mut tasks = tokio::task::JoinSet::new();
+    for (server, request) in requests {
+        let nh = nh.clone();
+        let semaphore = semaphore.clone();
+        tasks.spawn(async move {
+            let _permit = semaphore.acquire_owned().await;
+            call_server(nh, server, request).await
+        });
+    }
+    let mut outcomes = Vec::new();
+    while let Some(outcome) = tasks.join_next().await {
+        outcomes.push(outcome?);
+    }
+    outcomes.sort_by(|a, b| a.server.cmp(&b.server));
+    Ok(outcomes)
+}
+
+// the summary goes to stderr so a dump to stdout is only yaml
+fn print_summary(outcomes: &[Outcome], notes: &HashMap<String, String>, wall: Duration) {
+    let width = outcomes.iter().map(|o| o.server.len()).max().unwrap_or(0);
+    for outcome in outcomes {
+        let status = match &outcome.result {
+            Ok(_) => notes.get(&outcome.server).cloned().unwrap_or("ok".to_string()),
+            Err(err) => format!("failed: {err}"),
+        };
+        eprintln!(
+            "{:width$} {:8.1}ms {status}",
+            outcome.server,
+            outcome.elapsed.as_secs_f64() * 1000.0,
+        );
+    }
+    let failed = outcomes.iter().filter(|o| o.result.is_err()).count();
+    let slowest = outcomes.iter().map(|o| o.elapsed).max().unwrap_or_default();
+    eprintln!(
+        "{} servers, {failed} failed, {:.1}ms total, slowest {:.1}ms",
+        outcomes.len(),
+        wall.as_secs_f64() * 1000.0,
+        slowest.as_secs_f64() * 1000.0,
+    );
+}
+
+// every node with a parameter_descriptions topic
+async fn find_servers(ros_master_uri: &str, node_name: &str) -> Result<Vec<String>, anyhow::Error> {
+    let master = MasterClient::new(ros_master_uri, "http://localhost:0", node_name)
+        .await
+        .map_err(|err| anyhow::anyhow!("{err:?}"))?;
+    let topics = master
+        .get_published_topics("")
+        .await
+        .map_err(|err| anyhow::anyhow!("{err:?}"))?;
+    let mut servers: Vec<String> = topics
+        .into_iter()
+        .filter(|(_, topic_type)| topic_type == "dynamic_reconfigure/ConfigDescription")
+        .filter_map(|(topic, _)| topic.strip_suffix("/parameter_descriptions").map(str::to_string))
+        .collect();
+    servers.sort();
+    Ok(servers)
+}
+
+async fn dump(
+    nh: &NodeHandle,
+    ros_master_uri: &str,
+    node_name: &str,
+    file: Option<&String>,
+    jobs: usize,
+) -> Result<(), anyhow::Error> {
+    let t0 = Instant::now();
+    let servers = find_servers(ros_master_uri, node_name).await?;
+    let requests = servers.into_iter().map(|server| (server, None)).collect();
+    let outcomes = call_servers(nh, requests, jobs).await?;
+
+    let mut server_values = ServerValues::new();
+    for outcome in &outcomes {
+        if let Ok(config) = &outcome.result {
+            server_values.insert(outcome.server.clone(), config_values(config));
+        }
+    }
+    let text = serde_yaml::to_string(&server_values)?;
+    match file {
+        Some(file) => std::fs::write(file, text)?,
+        None => print!("{text}"),
+    }
+    print_summary(&outcomes, &HashMap::new(), t0.elapsed());
+    Ok(())
+}
+
+async fn load(nh: &NodeHandle, file: &str, jobs: usize) -> Result<(), anyhow::Error> {
+    let t0 = Instant::now();
+    let server_values: ServerValues = serde_yaml::from_str(&std::fs::read_to_string(file)?)?;
+    let requests = server_values
+        .iter()
+        .map(|(server, values)| {
+            let mut request = dynamic_reconfigure::ReconfigureRequest::default();
+            request.config = values_config(values);
+            (server.clone(), Some(request))
+        })
+        .collect();
+    let outcomes = call_servers(nh, requests, jobs).await?;
+
+    // the server may clamp values or not know about some params
+    let mut notes = HashMap::new();
+    for outcome in &outcomes {
+        if let Ok(config) = &outcome.result {
+            let response = config_values(config);
+            let values = &server_values[&outcome.server];
+            let not_set: Vec<&String> = values
+                .iter()
+                .filter(|(name, value)| response.get(*name) != Some(*value))
+                .map(|(name, _)| name)
+                .collect();
+            let note = if not_set.is_empty() {
+                format!("set {}", values.len())
+            } else {
+                format!("set {}, not set {not_set:?}", values.len() - not_set.len())
+            };
+            notes.insert(outcome.server.clone(), note);
+        }
+    }
+    print_summary(&outcomes, &notes, t0.elapsed());
+    if outcomes.iter().any(|o| o.result.is_err()) {
+        return Err(anyhow::anyhow!("not all servers in {file} were set"));
+    }
+    Ok(())
+}
 
 #[tokio::main]
 async fn main() -> Result<(), anyhow::Error> {
-    use roslibrust::ros1::NodeHandle;
-
-    let tracing_sub = tracing_subscriber::fmt().finish();
+    // logging goes to stderr so dump can write yaml to stdout
+    let tracing_sub = tracing_subscriber::fmt().with_writer(std::io::stderr).finish();
     tracing::subscriber::set_global_default(tracing_sub)?;
 
     let mut params = HashMap::<String, String>::new();
     params.insert("_name".to_string(), "dynrec".to_string());
     params.insert("_ns".to_string(), "".to_string());
+    params.insert("_jobs".to_string(), "16".to_string());
 
     // TODO(lucasw) can an existing rust arg handling library handle the ':=' ros cli args?
     let args = std::env::args();
@@ -26,20 +238,19 @@ async fn main() -> Result<(), anyhow::Error> {
             continue;
         }
 
-        let (mut key, val) = (key_val[0].to_string(), key_val[1].to_string());
+        let (key, val) = (key_val[0].to_string(), key_val[1].to_string());
         if !key.starts_with("_") {
-            println!("unused arg pair {key}:={val}- need to prefix name with underscore");
+            eprintln!("unused arg pair {key}:={val}- need to prefix name with underscore");
             continue;
         }
-        key.replace_range(0..1, "");
 
         if params.contains_key(&key) {
             params.insert(key, val);
         } else {
-            println!("unused '{key}' '{val}'");
+            eprintln!("unused '{key}' '{val}'");
         }
     }
-    println!("{args2:?}");
+    eprintln!("{args2:?}");
 
     let ns = params.remove("_ns").unwrap();
     let full_node_name = &format!(
@@ -51,6 +262,20 @@ async fn main() -> Result<(), anyhow::Error> {
     let nh = NodeHandle::new(&ros_master_uri, full_node_name).await?;
     tracing::info!("connected to roscore at {ros_master_uri}");
 
+    let jobs = params["_jobs"].parse::<usize>()?;
+    match args2.get(1).map(String::as_str) {
+        Some("dump") => {
+            return dump(&nh, &ros_master_uri, full_node_name, args2.get(2), jobs).await;
+        }
+        Some("load") => {
+            let file = args2
+                .get(2)
+                .ok_or(anyhow::anyhow!("usage: dynrec load file.yaml"))?;
+            return load(&nh, file, jobs).await;
+        }
+        _ => {}
+    }
+
     // TODO(lucasw) prefix ns to server name if no leading slash
     let partial_server_name = &args2[1];
     let full_server_name = &format!(
@@ -26,35 +26,108 @@ example parameters:
 'min': 0.0,
 'type': 'double'}
 '''
-# do a deep copy of this
-example_parameter = {
-    'description': 'tbd',
-    'name': 'tbd',
-    'cconsttype': 'const int',  # or const double, bool, str
-    'ctype': 'int',
-    'type': 'int',
-    'default': 0,
-    'min': 0,
-    'max': 2048,
-    'level': 1,
-    'edit_method': '',
-    'srcfile': '/opt/ros/jade/lib/python2.7/dist-packages/dynamic_reconfigure/parameter_generator_catkin.py',
-    'srcline': 280
-}
-
-# TODO(lucasw) support groups
-config_description = {
-    'upper': 'DEFAULT', 'lower': 'groups', 'srcline': 235,
-    'name': 'Default', 'parent': 0,
-    'srcfile': '/opt/ros/jade/lib/python2.7/dist-packages/dynamic_reconfigure/parameter_generator_catkin.py',
-    'cstate': 'true', 'parentname': 'Default', 'class': 'DEFAULT',
-    'field': 'default', 'state': True, 'parentclass': '',
-    'groups': [], 'parameters': [], 'type': '', 'id': 0
-}
-
-min = {}
-max = {}
-defaults = {}
-level = {}
-type = {}
-all_level = 0
+
+from collections import namedtuple, OrderedDict
+from types import MappingProxyType
+
+srcfile = '/opt/ros/jade/lib/python2.7/dist-packages/dynamic_reconfigure/parameter_generator_catkin.py'
+
+# one of these per parameter instead of a deep copy of a full parameter dict
+ParamRecord = namedtuple('ParamRecord', ['name', 'type', 'default', 'min', 'max',
+                                         'level', 'description', 'edit_method'])
+
+
+class BaseCfg():
+    # Stands in for a generated cfg module (e.g. ExampleConfig) as the type
+    # passed to dynamic_reconfigure.server.Server.
+    # Everything is built once in the constructor and can't be changed after,
+    # the flat tables are read only views and the parameter list is a tuple.
+    __slots__ = ('records', 'config_description', 'defaults', 'min', 'max',
+                 'level', 'type', 'all_level')
+
+    def __init__(self, records, all_level=None):
+        parameters = []
+        defaults = OrderedDict()
+        minimum = OrderedDict()
+        maximum = OrderedDict()
+        level = OrderedDict()
+        param_type = OrderedDict()
+        if all_level is None:
+            all_level = 0
+            for record in records:
+                all_level |= record.level
+
+        for record in records:
+            parameters.append({
+                'name': record.name,
+                'type': record.type,
+                'ctype': record.type,
+                'cconsttype': 'const ' + record.type,
+                'default': record.default,
+                'min': record.min,
+                'max': record.max,
+                'level': record.level,
+                'description': record.description,
+                'edit_method': record.edit_method,
+                'srcfile': srcfile,
+                'srcline': 280,
+            })
+            defaults[record.name] = record.default
+            minimum[record.name] = record.min
+            maximum[record.name] = record.max
+            level[record.name] = record.level
+            param_type[record.name] = record.type
+
+        # TODO(lucasw) support groups
+        config_description = {
+            'upper': 'DEFAULT', 'lower': 'groups', 'srcline': 235,
+            'name': 'Default', 'parent': 0,
+            'srcfile': srcfile,
+            'cstate': 'true', 'parentname': 'Default', 'class': 'DEFAULT',
+            'field': 'default', 'state': True, 'parentclass': '',
+            'groups': (), 'parameters': tuple(parameters), 'type': '', 'id': 0
+        }
+
+        setattr_ = super(BaseCfg, self).__setattr__
+        setattr_('records', tuple(records))
+        setattr_('config_description', config_description)
+        setattr_('defaults', MappingProxyType(defaults))
+        setattr_('min', MappingProxyType(minimum))
+        setattr_('max', MappingProxyType(maximum))
+        setattr_('level', MappingProxyType(level))
+        setattr_('type', MappingProxyType(param_type))
+        setattr_('all_level', all_level)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BaseCfg is immutable, use a ConfigDescriptor to make a new one")
+
+    def __delattr__(self, name):
+        raise AttributeError("BaseCfg is immutable, use a ConfigDescriptor to make a new one")
+
+
+class ConfigDescriptor():
+    # Collect parameters then build() a BaseCfg from them.
+    # Adding a name that already exists replaces it, so the same descriptor
+    # can be reused to rebuild a description without duplicating parameters.
+    def __init__(self):
+        self.records = OrderedDict()
+
+    def add(self, name, type, default, min, max, level=1, description='', edit_method=''):
+        self.records[name] = ParamRecord(name, type, default, min, max,
+                                         level, description, edit_method)
+        return self.records[name]
+
+    def remove(self, name):
+        return self.records.pop(name, None)
+
+    def clear(self):
+        self.records.clear()
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def build(self, all_level=None):
+        return BaseCfg(list(self.records.values()), all_level=all_level)
@@ -0,0 +1,115 @@
+# Lucas Walter
+# Open dynamic reconfigure clients to many servers at once,
+# and keep retrying the ones that aren't up yet in the background.
+
+import rospy
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dynamic_reconfigure.client import Client
+
+
+class ClientPool():
+    def __init__(self, on_connect=None, timeout=1.0,
+                 min_backoff=0.5, max_backoff=30.0, max_workers=16):
+        # on_connect(server_name, client) is called from a worker thread
+        # every time a server connects
+        self.on_connect = on_connect
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.lock = threading.Condition()
+        self.clients = {}
+        self.config_callbacks = {}
+        # server name -> [time of next attempt, current backoff]
+        self.retry = {}
+        self.in_flight = set()
+        self.is_shutdown = False
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.retry_thread = threading.Thread(target=self.retry_loop)
+        self.retry_thread.daemon = True
+        self.retry_thread.start()
+
+    def add(self, server_name, config_callback=None):
+        # returns immediately, the connection is made on the thread pool
+        with self.lock:
+            if server_name in self.config_callbacks:
+                return
+            self.config_callbacks[server_name] = config_callback
+            self.in_flight.add(server_name)
+        self.executor.submit(self.connect, server_name)
+
+    def get(self, server_name):
+        with self.lock:
+            return self.clients.get(server_name, None)
+
+    def connected(self):
+        with self.lock:
+            return list(self.clients.keys())
+
+    def missing(self):
+        with self.lock:
+            return [name for name in self.config_callbacks.keys() if name not in self.clients]
+
+    def connect(self, server_name):
+        with self.lock:
+            if self.is_shutdown:
+                return
+            config_callback = self.config_callbacks[server_name]
+        try:
+            client = Client(server_name, timeout=self.timeout,
+                            config_callback=config_callback)
+        except rospy.exceptions.ROSException as e:
+            with self.lock:
+                self.in_flight.discard(server_name)
+                backoff = self.min_backoff
+                if server_name in self.retry:
+                    backoff = min(self.retry[server_name][1] * 2.0, self.max_backoff)
+                self.retry[server_name] = [time.time() + backoff, backoff]
+                self.lock.notify()
+            rospy.logdebug("{} not available, retry in {:0.1f}s: {}".format(server_name, backoff, e))
+            return
+
+        with self.lock:
+            self.in_flight.discard(server_name)
+            self.retry.pop(server_name, None)
+            if self.is_shutdown:
+                client.close()
+                return
+            self.clients[server_name] = client
+        rospy.loginfo("connected to " + server_name)
+        if self.on_connect:
+            self.on_connect(server_name, client)
+
+    # wake up when the soonest retry is due and hand it to the thread pool
+    def retry_loop(self):
+        with self.lock:
+            while not self.is_shutdown:
+                if not self.retry:
+                    self.lock.wait()
+                    continue
+                now = time.time()
+                due = [name for name, (stamp, _) in self.retry.items()
+                       if stamp <= now and name not in self.in_flight]
+                for server_name in due:
+                    self.in_flight.add(server_name)
+                    self.executor.submit(self.connect, server_name)
+                waiting = [stamp for name, (stamp, _) in self.retry.items()
+                           if name not in self.in_flight]
+                if waiting:
+                    self.lock.wait(max(min(waiting) - now, 0.01))
+                else:
+                    self.lock.wait()
+
+    def shutdown(self):
+        with self.lock:
+            self.is_shutdown = True
+            clients = list(self.clients.values())
+            self.clients = {}
+            self.lock.notify()
+        self.executor.shutdown(wait=False)
+        for client in clients:
+            client.close()
@@ -0,0 +1,96 @@
+# Lucas Walter
+# Merge updates coming in from many threads into a single pending delta
+# (the latest value for each key wins) and hand that delta off from one
+# thread, no faster than a maximum rate and shortly after a burst ends.
+
+import rospy
+import threading
+import time
+
+
+class DeltaCoalescer():
+    # flush_fn(delta) is called from the coalescer thread with a dict of
+    # everything that changed since the last flush.
+    # max_rate is the most flushes per second (0 for no limit), settle is
+    # how long to wait for more updates after the latest one before flushing.
+    def __init__(self, flush_fn, max_rate=10.0, settle=0.02):
+        self.flush_fn = flush_fn
+        self.period = 1.0 / max_rate if max_rate > 0.0 else 0.0
+        self.settle = settle
+
+        self.lock = threading.Condition()
+        self.pending = {}
+        self.first_stamp = None
+        self.last_stamp = None
+        self.last_flush = 0.0
+        self.is_shutdown = False
+
+        self.num_received = 0
+        # updates that replaced a value still waiting to be flushed
+        self.num_merged = 0
+        # flush_fn calls and the keys sent in them
+        self.num_flushes = 0
+        self.num_flushed = 0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, key, value):
+        self.update({key: value})
+
+    def update(self, delta):
+        with self.lock:
+            now = time.time()
+            if not self.pending:
+                self.first_stamp = now
+            self.last_stamp = now
+            for key, value in delta.items():
+                self.num_received += 1
+                if key in self.pending:
+                    self.num_merged += 1
+                self.pending[key] = value
+            self.lock.notify()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'received': self.num_received,
+                'merged': self.num_merged,
+                'flushes': self.num_flushes,
+                'flushed': self.num_flushed,
+                'pending': len(self.pending),
+            }
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.is_shutdown:
+                    if not self.pending:
+                        self.lock.wait()
+                        continue
+                    # wait for the burst to end, but not longer than a period,
+                    # and never flush faster than max_rate
+                    deadline = max(self.last_flush + self.period,
+                                   min(self.last_stamp + self.settle,
+                                       self.first_stamp + self.period))
+                    remaining = deadline - time.time()
+                    if remaining <= 0.0:
+                        break
+                    self.lock.wait(remaining)
+                if self.is_shutdown:
+                    return
+                delta = self.pending
+                self.pending = {}
+                self.last_flush = time.time()
+                self.num_flushes += 1
+                self.num_flushed += len(delta)
+            try:
+                self.flush_fn(delta)
+            except Exception as ex:
+                rospy.logerr("flushing {} updates failed: {}".format(len(delta), ex))
+
+    def shutdown(self):
+        with self.lock:
+            self.is_shutdown = True
+            self.lock.notify()
@@ -0,0 +1,49 @@
+# Lucas Walter
+# A dynamic reconfigure Server that can have its parameter set replaced
+# while it is running, instead of creating a new Server (and new
+# publishers and service) every time the parameters change.
+
+import rospy
+
+from dynamic_reconfigure.encoding import encode_config, encode_description
+from dynamic_reconfigure.encoding import extract_params, get_tree, initial_config
+from dynamic_reconfigure.server import Server
+
+
+class LiveServer(Server):
+    # type is a BaseCfg (or a generated cfg module), parameters that survive
+    # keep their current values, new ones get the parameter server value or
+    # their default, and parameters that went away are dropped.
+    # A fresh ConfigDescription is published on the existing
+    # parameter_descriptions topic, then the callback is called with the
+    # level of everything that was added.
+    def set_type(self, type):
+        with self.mutex:
+            old_config = self.config
+            old_names = set([param['name'] for param in extract_params(self.type.config_description)])
+
+            self.type = type
+            self.description = encode_description(type)
+
+            config = type.defaults.copy()
+            level = 0
+            for param in extract_params(type.config_description):
+                name = param['name']
+                if name in old_names:
+                    config[name] = old_config[name]
+                else:
+                    config[name] = rospy.get_param(self.ns + name, config[name])
+                    level |= param['level']
+            self._clamp(config)
+
+            new_names = set(config.keys())
+            for name in old_names - new_names:
+                try:
+                    rospy.delete_param(self.ns + name)
+                except KeyError:
+                    pass
+
+            config['groups'] = get_tree(self.description)
+            config = initial_config(encode_config(config), type.config_description)
+            self.descr_topic.publish(self.description)
+            return self._change_config(config, level)
@@ -0,0 +1,68 @@
+# Lucas Walter
+# Turn a field path like 'linear.x' inside a message type into a setter
+# function once, so setting it later doesn't have to look anything up.
+
+from operator import attrgetter
+
+
+# with no field given, a message with a single field (like std_msgs/Float64)
+# uses that field
+def default_field(msg_class):
+    slots = msg_class.__slots__
+    if len(slots) != 1:
+        raise ValueError("{} has fields {}, need to specify which one to use".format(
+                         msg_class._type, slots))
+    return slots[0]
+
+
+# returns the list of field names along the path and the default value
+# of the last one, raising ValueError if the path doesn't exist
+def resolve_field(msg_class, field=None):
+    if field is None or field == '':
+        field = default_field(msg_class)
+    parts = field.split('.')
+    value = msg_class()
+    for i, part in enumerate(parts):
+        slots = getattr(value, '__slots__', [])
+        if part not in slots:
+            raise ValueError("'{}' in '{}' is not a field of {}, fields are {}".format(
+                             part, field, msg_class._type, slots))
+        value = getattr(value, part)
+    return parts, value
+
+
+def make_cast(default_value):
+    # bool before int, bool is a subclass of int
+    for base_type in [bool, int, float, str]:
+        if isinstance(default_value, base_type):
+            return base_type
+    return None
+
+
+# setter(msg, value) sets the field at the end of field path in msg,
+# converting the value to the type of the field
+def compile_setter(msg_class, field=None):
+    parts, default_value = resolve_field(msg_class, field)
+    leaf = parts[-1]
+    cast = make_cast(default_value)
+    if len(parts) == 1:
+        if cast is None:
+            def setter(msg, value):
+                setattr(msg, leaf, value)
+        else:
+            def setter(msg, value):
+                setattr(msg, leaf, cast(value))
+    else:
+        get_parent = attrgetter('.'.join(parts[:-1]))
+        if cast is None:
+            def setter(msg, value):
+                setattr(get_parent(msg), leaf, value)
+        else:
+            def setter(msg, value):
+                setattr(get_parent(msg), leaf, cast(value))
+    return setter
+
+
+def compile_getter(msg_class, field=None):
+    parts, _ = resolve_field(msg_class, field)
+    return attrgetter('.'.join(parts))
@@ -0,0 +1,507 @@
+# Lucas Walter
+# A dynamic reconfigure server that works directly on ConfigDescription and
+# Config messages, with no generated cfg module, for servers with thousands
+# of parameters where encoding and decoding full config dicts on every
+# request is too slow.
+# Every parameter is found by name in a table, a request only touches the
+# parameters in it, and the full Config is published on parameter_updates.
+# Parameters and groups can be added and removed while it is running,
+# a burst of those is published as one new description.
+
+import contextlib
+import copy
+import rospy
+import threading
+
+from collections import OrderedDict
+from dynamic_reconfigure.msg import BoolParameter, Config, ConfigDescription
+from dynamic_reconfigure.msg import DoubleParameter, Group, GroupState, IntParameter
+from dynamic_reconfigure.msg import ParamDescription, StrParameter
+from dynamic_reconfigure.srv import Reconfigure, ReconfigureResponse
+
+# param type -> the Config list it goes in, its message type and python type
+param_types = {
+    'bool': ('bools', BoolParameter, bool),
+    'int': ('ints', IntParameter, int),
+    'str': ('strs', StrParameter, str),
+    'double': ('doubles', DoubleParameter, float),
+}
+
+# min and max used when they aren't given, clients expect every
+# parameter to have them
+type_limits = {
+    'bool': (False, True),
+    'int': (-2**31, 2**31 - 1),
+    'str': ('', ''),
+    'double': (-float('inf'), float('inf')),
+}
+
+root_group = 'Default'
+
+
+# name -> value for every parameter of one type in a Config
+def config_values(config, param_type):
+    list_name = param_types[param_type][0]
+    values = {}
+    for param in getattr(config, list_name):
+        values[param.name] = param.value
+    return values
+
+
+class MsgServer():
+    # callback(changes, level) gets a dict of only the parameters that changed
+    # and the OR of their levels, and returns the changes to apply, which
+    # it may modify (or None to apply them as they are).
+    # description can be None to start with no parameters and add them later.
+    # With set_params the parameter server is read once at startup for
+    # initial values and then kept up to date with every change.
+    # Adding or removing parameters publishes a new description
+    # description_delay seconds later, so a burst of them goes out together.
+    def __init__(self, description, callback, namespace="~", set_params=True,
+                 description_delay=0.05):
+        self.callback = callback
+        self.set_params = set_params
+        self.description_delay = description_delay
+        self.lock = threading.RLock()
+        self.ns = rospy.resolve_name(namespace)
+        if not self.ns.endswith('/'):
+            self.ns += '/'
+        self.running = False
+
+        # name -> type, level, min, max, default and ParamDescription
+        self.types = {}
+        self.levels = {}
+        self.min = {}
+        self.max = {}
+        self.defaults = {}
+        self.param_descs = {}
+        # name -> position in the typed list of self.config
+        self.index = {}
+        self.config = Config()
+        # group name -> Group without its parameters, and its parameter names in order
+        self.groups = OrderedDict()
+        self.group_params = {}
+        self.root = None
+        self.next_group_id = 0
+        # parameter name -> group name
+        self.group_of = {}
+
+        self.description = None
+        self.description_dirty = False
+        self.batch_depth = 0
+        # inside a batch, what was in the namespace when it started and
+        # the parameter server changes to make in one call when it ends
+        self.batch_params = None
+        self.batch_writes = {}
+        self.batch_deletes = set()
+        self.publish_timer = None
+        self.num_requests = 0
+        self.num_changed = 0
+        self.num_description_changes = 0
+        self.num_description_publishes = 0
+
+        self.initial = {}
+        if self.set_params:
+            self.initial = self.read_namespace()
+
+        with self.lock:
+            if description is None:
+                self.add_group(root_group)
+            else:
+                self.add_description(description)
+
+            self.descr_topic = rospy.Publisher(self.ns + 'parameter_descriptions', ConfigDescription,
+                                               latch=True, queue_size=10)
+            self.update_topic = rospy.Publisher(self.ns + 'parameter_updates', Config,
+                                                latch=True, queue_size=10)
+            if self.set_params:
+                self.copy_to_parameter_server(self.initial)
+            self.running = True
+            self.publish_description()
+        self.set_service = rospy.Service(self.ns + 'set_parameters', Reconfigure,
+                                         self.set_callback)
+
+    def add_description(self, description):
+        description = copy.deepcopy(description)
+        defaults = {}
+        minimum = {}
+        maximum = {}
+        for param_type in param_types.keys():
+            defaults[param_type] = config_values(description.dflt, param_type)
+            minimum[param_type] = config_values(description.min, param_type)
+            maximum[param_type] = config_values(description.max, param_type)
+
+        # groups refer to their parent by id
+        group_names = {}
+        for group in description.groups:
+            group_names[group.id] = group.name
+        for group in description.groups:
+            parent = None
+            if group.id != group.parent:
+                parent = group_names.get(group.parent, None)
+            self.add_group(group.name, parent=parent, type=group.type)
+            for param in group.parameters:
+                if param.type not in param_types:
+                    raise ValueError("{} has unsupported type {}".format(param.name, param.type))
+                if param.name in self.types:
+                    raise ValueError("{} is in the description more than once".format(param.name))
+                cast = param_types[param.type][2]
+                self.add_param(param.name, param.type,
+                               defaults[param.type].get(param.name, cast()),
+                               min=minimum[param.type].get(param.name, None),
+                               max=maximum[param.type].get(param.name, None),
+                               level=param.level, description=param.description,
+                               edit_method=param.edit_method, group=group.name)
+
+    def clamp(self, name, value):
+        minimum = self.min.get(name, None)
+        maximum = self.max.get(name, None)
+        if minimum is not None and value < minimum:
+            value = minimum
+        if maximum is not None and value > maximum:
+            value = maximum
+        return value
+
+    def get(self, name):
+        with self.lock:
+            list_name = param_types[self.types[name]][0]
+            return getattr(self.config, list_name)[self.index[name]].value
+
+    def get_config(self):
+        with self.lock:
+            config = {}
+            for name in self.types.keys():
+                config[name] = self.get(name)
+            return config
+
+    # Adds a group under parent (the root group if None), or updates the type
+    # of an existing one.  The first group added is the root.
+    def add_group(self, name, parent=None, type=''):
+        with self.lock:
+            if name in self.groups:
+                if self.groups[name].type != type:
+                    self.groups[name].type = type
+                    self.mark_changed()
+                return
+            if parent is None:
+                parent = self.root
+            if parent is not None and parent not in self.groups:
+                raise ValueError("parent group {} of {} doesn't exist".format(parent, name))
+            group_id = self.next_group_id
+            self.next_group_id += 1
+            if parent is None:
+                self.root = name
+                parent_id = group_id
+            else:
+                parent_id = self.groups[parent].id
+            self.groups[name] = Group(name=name, type=type, parameters=[],
+                                      parent=parent_id, id=group_id)
+            self.group_params[name] = []
+            self.config.groups.append(GroupState(name=name, state=True, id=group_id,
+                                                 parent=parent_id))
+            self.mark_changed()
+
+    # removes the group with its parameters and the groups under it
+    def remove_group(self, name):
+        with self.lock:
+            if name not in self.groups:
+                return False
+            if name == self.root:
+                raise ValueError("can't remove the root group {}".format(name))
+            group_id = self.groups[name].id
+            for child in [group.name for group in self.groups.values() if group.parent == group_id]:
+                self.remove_group(child)
+            for param in list(self.group_params[name]):
+                self.remove_param(param)
+            del self.groups[name]
+            del self.group_params[name]
+            self.config.groups = [state for state in self.config.groups if state.name != name]
+            self.mark_changed()
+            return True
+
+    # Adds a parameter to a group (the root group if None), or replaces the
+    # description of an existing one.  Adding one that is already there
+    # exactly as given changes nothing.
+    # A new parameter starts with its parameter server value if there is one,
+    # an existing one keeps its value if the type is the same.
+    # Returns the value, the callback isn't called for it.
+    def add_param(self, name, type, default, min=None, max=None, level=1,
+                  description='', edit_method='', group=None):
+        if type not in param_types:
+            raise ValueError("{} has unsupported type {}".format(name, type))
+        with self.lock:
+            if group is None:
+                if self.root is None:
+                    self.add_group(root_group)
+                group = self.root
+            if group not in self.groups:
+                self.add_group(group)
+            list_name, msg_type, cast = param_types[type]
+            if type in ['int', 'double']:
+                min = type_limits[type][0] if min is None else min
+                max = type_limits[type][1] if max is None else max
+            if self.is_same_param(name, type, cast(default), min, max, level,
+                                  description, edit_method, group):
+                return self.get(name)
+            old_value = None
+            if name in self.types:
+                if self.types[name] == type:
+                    old_value = self.get(name)
+                self.remove_param(name, delete_param=False)
+
+            self.types[name] = type
+            self.levels[name] = level
+            if type in ['int', 'double']:
+                self.min[name] = min
+                self.max[name] = max
+            self.defaults[name] = cast(default)
+            self.param_descs[name] = ParamDescription(name=name, type=type, level=level,
+                                                      description=description,
+                                                      edit_method=edit_method)
+            self.group_of[name] = group
+            self.group_params[group].append(name)
+
+            if old_value is not None:
+                value = old_value
+            elif self.batch_params is not None:
+                value = self.batch_params.get(name, default)
+            elif self.running and self.set_params:
+                value = rospy.get_param(self.ns + name, default)
+            else:
+                value = self.initial.get(name, default)
+            try:
+                value = self.clamp(name, cast(value))
+            except (TypeError, ValueError) as ex:
+                rospy.logwarn("bad parameter server value for {}: {}".format(name, ex))
+                value = self.clamp(name, self.defaults[name])
+            params = getattr(self.config, list_name)
+            self.index[name] = len(params)
+            params.append(msg_type(name, value))
+            if self.batch_params is not None:
+                self.batch_writes[name] = value
+                self.batch_deletes.discard(name)
+            elif self.running and self.set_params:
+                rospy.set_param(self.ns + name, value)
+            self.mark_changed()
+            return value
+
+    def is_same_param(self, name, type, default, min, max, level,
+                      description, edit_method, group):
+        if name not in self.types:
+            return False
+        param_desc = self.param_descs[name]
+        return (self.types[name] == type and self.levels[name] == level and
+                self.min.get(name, None) == (min if type in ['int', 'double'] else None) and
+                self.max.get(name, None) == (max if type in ['int', 'double'] else None) and
+                self.defaults[name] == default and self.group_of[name] == group and
+                param_desc.description == description and param_desc.edit_method == edit_method)
+
+    def remove_param(self, name, delete_param=True):
+        with self.lock:
+            if name not in self.types:
+                return False
+            list_name = param_types[self.types[name]][0]
+            # move the last parameter into the removed one's place,
+            # so the others don't have to be renumbered.
+            # Published configs have their own lists so this doesn't change them.
+            params = getattr(self.config, list_name)
+            ind = self.index.pop(name)
+            last = params.pop()
+            if last.name != name:
+                params[ind] = last
+                self.index[last.name] = ind
+
+            self.group_params[self.group_of.pop(name)].remove(name)
+            for table in [self.types, self.levels, self.min, self.max,
+                          self.defaults, self.param_descs]:
+                table.pop(name, None)
+            if delete_param and self.batch_params is not None:
+                self.batch_writes.pop(name, None)
+                self.batch_deletes.add(name)
+            elif delete_param and self.set_params:
+                try:
+                    rospy.delete_param(self.ns + name)
+                except KeyError:
+                    pass
+            self.mark_changed()
+            return True
+
+    # Changes made inside a batch are published together when it ends,
+    # instead of after description_delay, and the parameter server is
+    # read once when it starts and written once when it ends
+    @contextlib.contextmanager
+    def batch(self):
+        with self.lock:
+            self.batch_depth += 1
+            if self.batch_depth == 1 and self.running and self.set_params:
+                self.batch_params = self.read_namespace()
+                self.batch_writes = {}
+                self.batch_deletes = set()
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.write_batch_params()
+                    if self.description_dirty:
+                        self.publish_description()
+
+    def read_namespace(self):
+        params = rospy.get_param(self.ns[:-1] if self.ns != '/' else '/', {})
+        if not isinstance(params, dict):
+            params = {}
+        return params
+
+    # Anything else set in the namespace during the batch is overwritten
+    # with what was there at the start
+    def write_batch_params(self):
+        params = self.batch_params
+        self.batch_params = None
+        if params is None or (not self.batch_writes and not self.batch_deletes):
+            return
+        if self.ns == '/':
+            # setting the root namespace would replace every parameter
+            for name, value in self.batch_writes.items():
+                rospy.set_param('/' + name, value)
+            for name in self.batch_deletes:
+                try:
+                    rospy.delete_param('/' + name)
+                except KeyError:
+                    pass
+            return
+        params = dict(params)
+        params.update(self.batch_writes)
+        for name in self.batch_deletes:
+            params.pop(name, None)
+        rospy.set_param(self.ns[:-1], params)
+
+    def mark_changed(self):
+        self.description_dirty = True
+        self.num_description_changes += 1
+        # the constructor publishes once everything is added
+        if not self.running or self.batch_depth > 0 or self.publish_timer is not None:
+            return
+        self.publish_timer = threading.Timer(self.description_delay, self.publish_description)
+        self.publish_timer.daemon = True
+        self.publish_timer.start()
+
+    def build_description(self):
+        description = ConfigDescription()
+        for name, group in self.groups.items():
+            params = self.group_params[name]
+            description.groups.append(Group(name=group.name, type=group.type,
+                                            parameters=[self.param_descs[param] for param in params],
+                                            parent=group.parent, id=group.id))
+            for param in params:
+                param_type = self.types[param]
+                list_name, msg_type, _ = param_types[param_type]
+                if param_type in ['int', 'double']:
+                    minimum = self.min[param]
+                    maximum = self.max[param]
+                else:
+                    minimum, maximum = type_limits[param_type]
+                getattr(description.dflt, list_name).append(msg_type(param, self.defaults[param]))
+                getattr(description.min, list_name).append(msg_type(param, minimum))
+                getattr(description.max, list_name).append(msg_type(param, maximum))
+        description.dflt.groups = list(self.config.groups)
+        description.min.groups = list(self.config.groups)
+        description.max.groups = list(self.config.groups)
+        return description
+
+    # Publishes the description, and then the config that goes with it,
+    # if anything was added or removed since the last time
+    def publish_description(self):
+        with self.lock:
+            if self.publish_timer is not None:
+                self.publish_timer.cancel()
+                self.publish_timer = None
+            if not self.description_dirty:
+                return
+            self.description_dirty = False
+            self.description = self.build_description()
+            self.descr_topic.publish(self.description)
+            self.update_topic.publish(self.snapshot())
+            self.num_description_publishes += 1
+            rospy.logdebug("{} params in {} groups, {} description changes in {} publishes".format(
+                           len(self.types), len(self.groups), self.num_description_changes,
+                           self.num_description_publishes))
+
+    # The published Config has its own lists, and changed parameters are
+    # replaced rather than modified, so a published (and latched) message
+    # never changes after it is sent
+    def snapshot(self):
+        config = Config()
+        config.bools = list(self.config.bools)
+        config.ints = list(self.config.ints)
+        config.strs = list(self.config.strs)
+        config.doubles = list(self.config.doubles)
+        config.groups = list(self.config.groups)
+        return config
+
+    # set all the values with one set of the namespace, params is what
+    # was already in the namespace so other parameters in it are kept
+    def copy_to_parameter_server(self, params):
+        config = self.get_config()
+        if self.ns == '/':
+            # setting the root namespace would replace every parameter
+            for name, value in config.items():
+                rospy.set_param('/' + name, value)
+            return
+        params = dict(params)
+        params.update(config)
+        rospy.set_param(self.ns[:-1], params)
+
+    # Changes from a request, or from the node itself, are converted to the
+    # type of the parameter and clamped, then only the ones that
+    # differ from the current values go to the callback and get applied.
+    # Returns the full config after the changes as a Config message
+    def update_configuration(self, changes):
+        with self.lock:
+            self.num_requests += 1
+            changed = {}
+            level = 0
+            for name, value in changes.items():
+                param_type = self.types.get(name, None)
+                if param_type is None:
+                    rospy.logwarn_throttle(5.0, "{} isn't a parameter of {}".format(name, self.ns))
+                    continue
+                try:
+                    value = self.clamp(name, param_types[param_type][2](value))
+                except (TypeError, ValueError) as ex:
+                    rospy.logwarn("bad value for {}: {}".format(name, ex))
+                    continue
+                if value == self.get(name):
+                    continue
+                changed[name] = value
+                level |= self.levels[name]
+
+            if changed:
+                result = self.callback(changed, level)
+                if result is not None:
+                    changed = result
+                self.apply(changed)
+            config = self.snapshot()
+            # with a description on the way the config goes out right after it
+            if changed and not self.description_dirty:
+                self.update_topic.publish(config)
+            return config
+
+    def apply(self, changed):
+        for name, value in changed.items():
+            param_type = self.types.get(name, None)
+            if param_type is None:
+                continue
+            list_name, msg_type, cast = param_types[param_type]
+            value = self.clamp(name, cast(value))
+            getattr(self.config, list_name)[self.index[name]] = msg_type(name, value)
+            if self.set_params:
+                rospy.set_param(self.ns + name, value)
+        self.num_changed += len(changed)
+
+    def set_callback(self, req):
+        changes = {}
+        for params in [req.config.bools, req.config.ints, req.config.strs, req.config.doubles]:
+            for param in params:
+                changes[param.name] = param.value
+        return ReconfigureResponse(self.update_configuration(changes))
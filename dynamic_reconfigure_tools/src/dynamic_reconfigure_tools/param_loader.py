@@ -0,0 +1,48 @@
+# Lucas Walter
+# Load a tree of control definitions from the parameter server
+# with a single get_param instead of a get_param per key.
+
+import rospy
+import time
+
+from collections import OrderedDict
+
+
+# dr2dr controls are mixed lists
+# [server name, server value name, type, level, description, default value, min, max]
+def is_list_control(value):
+    return isinstance(value, list)
+
+
+# dr_topics controls are dicts with name, topic, type, min, max and default
+def is_dict_control(value):
+    return isinstance(value, dict) and 'name' in value
+
+
+def flatten_controls(tree, is_control, prefix=""):
+    controls = OrderedDict()
+    if not isinstance(tree, dict):
+        return controls
+    for key in sorted(tree.keys()):
+        value = tree[key]
+        param = prefix + key
+        if is_control(value):
+            controls[param] = value
+        elif isinstance(value, dict):
+            controls.update(flatten_controls(value, is_control, param + "/"))
+    return controls
+
+
+# returns an ordered dict of control param name (relative to the
+# controls namespace, e.g. 'camera/exposure') to its definition
+def load_controls(is_control, name="controls"):
+    t0 = time.time()
+    tree = rospy.get_param(name, {})
+    t1 = time.time()
+    controls = flatten_controls(tree, is_control)
+    t2 = time.time()
+    if len(controls) == 0:
+        rospy.logwarn("no controls found in '{}'".format(rospy.resolve_name(name)))
+    rospy.loginfo("loaded {} controls from '{}' in {:0.3f}s ({:0.3f}s fetch, {:0.3f}s parse)".format(
+                  len(controls), rospy.resolve_name(name), t2 - t0, t1 - t0, t2 - t1))
+    return controls
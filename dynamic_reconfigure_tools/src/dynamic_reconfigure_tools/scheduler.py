@@ -0,0 +1,90 @@
+# Lucas Walter
+# Run many periodic callbacks from a single thread, ordered by a heap
+# of next due times, instead of a thread per rospy.Timer.
+
+import heapq
+import itertools
+import rospy
+import threading
+import time
+
+
+class PeriodicScheduler():
+    # Uses wall time, like the rqt plugins, so a paused sim clock doesn't
+    # stop anything.  A callback that runs late is not called again to
+    # catch up, the missed periods are skipped.
+    def __init__(self):
+        self.lock = threading.Condition()
+        # [due time, sequence, key], the sequence keeps ties in insertion order
+        self.heap = []
+        # key -> [period, callback, sequence]
+        self.entries = {}
+        self.counter = itertools.count()
+        self.is_shutdown = False
+        self.num_calls = 0
+        self.num_skipped = 0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, key, period, callback, delay=0.0):
+        if period <= 0.0:
+            raise ValueError("period for {} has to be positive: {}".format(key, period))
+        with self.lock:
+            seq = next(self.counter)
+            # an existing entry for this key is superseded, its heap item is
+            # dropped when it comes up because the sequence won't match
+            self.entries[key] = [period, callback, seq]
+            heapq.heappush(self.heap, [time.time() + delay, seq, key])
+            self.lock.notify()
+
+    def remove(self, key):
+        with self.lock:
+            return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.heap = []
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.is_shutdown:
+                    if not self.heap:
+                        self.lock.wait()
+                        continue
+                    due, seq, key = self.heap[0]
+                    entry = self.entries.get(key)
+                    if entry is None or entry[2] != seq:
+                        heapq.heappop(self.heap)
+                        continue
+                    remaining = due - time.time()
+                    if remaining <= 0.0:
+                        break
+                    self.lock.wait(remaining)
+                if self.is_shutdown:
+                    return
+                period, callback, _ = entry
+                now = time.time()
+                next_due = due + period
+                if next_due <= now:
+                    skipped = int((now - next_due) / period) + 1
+                    self.num_skipped += skipped
+                    next_due += skipped * period
+                heapq.heapreplace(self.heap, [next_due, seq, key])
+                self.num_calls += 1
+            try:
+                callback()
+            except Exception as ex:
+                rospy.logerr("periodic callback {} failed: {}".format(key, ex))
+
+    def shutdown(self):
+        with self.lock:
+            self.is_shutdown = True
+            self.lock.notify()
@@ -0,0 +1,129 @@
+# Lucas Walter
+# Content addressed snapshots of the configs of many dynamic reconfigure servers.
+# Each distinct server config is stored once under the hash of its contents,
+# and a snapshot is only a server name -> config hash map with a hash of its own,
+# so taking a snapshot when few servers have changed costs little, and diffing
+# two snapshots skips every server whose config hash is the same in both.
+
+import hashlib
+import json
+import os
+import threading
+
+
+def config_hash(config):
+    text = json.dumps(config, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+# server -> {key: (a value, b value)} for every key that differs,
+# None stands in for a key or server missing on one side
+def diff_configs(configs_a, configs_b):
+    diff = {}
+    for server in set(configs_a.keys()) | set(configs_b.keys()):
+        config_a = configs_a.get(server, {})
+        config_b = configs_b.get(server, {})
+        if config_a == config_b:
+            continue
+        server_diff = {}
+        for key in set(config_a.keys()) | set(config_b.keys()):
+            value_a = config_a.get(key, None)
+            value_b = config_b.get(key, None)
+            if value_a != value_b:
+                server_diff[key] = (value_a, value_b)
+        diff[server] = server_diff
+    return diff
+
+
+# the changes to send to each server to get from configs_a to configs_b,
+# keys that aren't in configs_b are left alone
+def config_delta(configs_a, configs_b):
+    delta = {}
+    for server, server_diff in diff_configs(configs_a, configs_b).items():
+        changes = dict([(key, value_b) for key, (value_a, value_b) in server_diff.items()
+                        if value_b is not None])
+        if changes:
+            delta[server] = changes
+    return delta
+
+
+class SnapshotStore():
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        # config hash -> config
+        self.configs = {}
+        # snapshot id -> {server name: config hash}
+        self.snapshots = {}
+        # name -> snapshot id
+        self.names = {}
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    # returns the id of the snapshot, which is the same for the same configs
+    def record(self, configs, name=None):
+        with self.lock:
+            hashes = {}
+            for server, config in configs.items():
+                key = config_hash(config)
+                self.configs.setdefault(key, dict(config))
+                hashes[server] = key
+            snapshot_id = config_hash(hashes)
+            self.snapshots[snapshot_id] = hashes
+            if name is not None:
+                self.names[name] = snapshot_id
+            return snapshot_id
+
+    # a name or a snapshot id, None if there isn't one
+    def resolve(self, name):
+        with self.lock:
+            if name in self.names:
+                return self.names[name]
+            if name in self.snapshots:
+                return name
+            return None
+
+    # server -> config, copies that can be changed
+    def get(self, name):
+        snapshot_id = self.resolve(name)
+        if snapshot_id is None:
+            raise KeyError("no snapshot '{}'".format(name))
+        with self.lock:
+            return dict([(server, dict(self.configs[key]))
+                         for server, key in self.snapshots[snapshot_id].items()])
+
+    def diff(self, name_a, name_b):
+        id_a = self.resolve(name_a)
+        id_b = self.resolve(name_b)
+        if id_a is None or id_b is None:
+            raise KeyError("no snapshot '{}'".format(name_b if id_a else name_a))
+        with self.lock:
+            hashes_a = self.snapshots[id_a]
+            hashes_b = self.snapshots[id_b]
+            # only look inside configs that changed
+            changed = [server for server in set(hashes_a.keys()) | set(hashes_b.keys())
+                       if hashes_a.get(server) != hashes_b.get(server)]
+            configs_a = dict([(server, self.configs[hashes_a[server]])
+                              for server in changed if server in hashes_a])
+            configs_b = dict([(server, self.configs[hashes_b[server]])
+                              for server in changed if server in hashes_b])
+        return diff_configs(configs_a, configs_b)
+
+    def save(self, path=None):
+        path = path or self.path
+        with self.lock:
+            data = {'configs': self.configs, 'snapshots': self.snapshots, 'names': self.names}
+            text = json.dumps(data, sort_keys=True, indent=1)
+        # write then rename so a crash doesn't leave half a file
+        with open(path + '.tmp', 'w') as outfile:
+            outfile.write(text)
+        os.rename(path + '.tmp', path)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path) as infile:
+            data = json.load(infile)
+        with self.lock:
+            self.configs.update(data['configs'])
+            self.snapshots.update(data['snapshots'])
+            self.names.update(data['names'])
@@ -0,0 +1,6 @@
+//! dynamic reconfigure server support shared by the binaries and examples
+
+roslibrust_codegen_macro::find_and_generate_ros_messages!();
+
+pub mod param_store;
+pub mod server;
@@ -0,0 +1,229 @@
+//! dynamic reconfigure parameters indexed by name, converted to and from
+//! Config and ConfigDescription messages as needed
+
+use crate::dynamic_reconfigure;
+use serde::{Deserialize, Serialize};
+use std::collections::{BTreeMap, HashMap};
+
+// untagged so values are plain yaml scalars, a double always has a decimal point
+// when serialized so it comes back as a double
+#[derive(Clone, Debug, PartialEq, Serialize, Deserialize)]
+#[serde(untagged)]
+pub enum Value {
+    Bool(bool),
+    Int(i32),
+    Double(f64),
+    Str(String),
+}
+
+impl Value {
+    pub fn type_name(&self) -> &'static str {
+        match self {
+            Value::Bool(_) => "bool",
+            Value::Int(_) => "int",
+            Value::Double(_) => "double",
+            Value::Str(_) => "str",
+        }
+    }
+
+    // convert to the type of other, ints and doubles can be converted to each other
+    fn coerce(self, other: &Value) -> Option<Value> {
+        match (self, other) {
+            (Value::Bool(v), Value::Bool(_)) => Some(Value::Bool(v)),
+            (Value::Int(v), Value::Int(_)) => Some(Value::Int(v)),
+            (Value::Double(v), Value::Int(_)) => Some(Value::Int(v.round() as i32)),
+            (Value::Int(v), Value::Double(_)) => Some(Value::Double(v as f64)),
+            (Value::Double(v), Value::Double(_)) => Some(Value::Double(v)),
+            (Value::Str(v), Value::Str(_)) => Some(Value::Str(v)),
+            _ => None,
+        }
+    }
+
+    fn clamp(self, min: &Value, max: &Value) -> Value {
+        match (self, min, max) {
+            (Value::Int(v), Value::Int(min), Value::Int(max)) => Value::Int(v.max(*min).min(*max)),
+            (Value::Double(v), Value::Double(min), Value::Double(max)) => {
+                Value::Double(v.max(*min).min(*max))
+            }
+            (v, _, _) => v,
+        }
+    }
+}
+
+#[derive(Clone, Debug)]
+struct Param {
+    name: String,
+    value: Value,
+    default: Value,
+    min: Value,
+    max: Value,
+    level: u32,
+    description: String,
+}
+
+#[derive(Clone, Debug, Default)]
+pub struct ParamStore {
+    // in the order they were added, which is the order clients show them in
+    params: Vec<Param>,
+    index: HashMap<String, usize>,
+}
+
+impl ParamStore {
+    pub fn new() -> Self {
+        Self::default()
+    }
+
+    pub fn len(&self) -> usize {
+        self.params.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.params.is_empty()
+    }
+
+    /// min and max are converted to the type of default, they don't matter for bools and strs
+    pub fn add(
+        &mut self,
+        name: &str,
+        default: Value,
+        min: Value,
+        max: Value,
+        level: u32,
+        description: &str,
+    ) -> Result<(), anyhow::Error> {
+        if self.index.contains_key(name) {
+            return Err(anyhow::anyhow!("parameter '{name}' already exists"));
+        }
+        let type_name = default.type_name();
+        let min = min
+            .coerce(&default)
+            .ok_or_else(|| anyhow::anyhow!("'{name}' min isn't a {type_name}"))?;
+        let max = max
+            .coerce(&default)
+            .ok_or_else(|| anyhow::anyhow!("'{name}' max isn't a {type_name}"))?;
+        let default = default.clamp(&min, &max);
+        self.index.insert(name.to_string(), self.params.len());
+        self.params.push(Param {
+            name: name.to_string(),
+            value: default.clone(),
+            default,
+            min,
+            max,
+            level,
+            description: description.to_string(),
+        });
+        Ok(())
+    }
+
+    pub fn get(&self, name: &str) -> Option<&Value> {
+        self.index.get(name).map(|&ind| &self.params[ind].value)
+    }
+
+    /// the value is clamped to the parameter limits,
+    /// returns the level of the parameter if the value changed
+    pub fn set(&mut self, name: &str, value: Value) -> Result<Option<u32>, anyhow::Error> {
+        let ind = *self
+            .index
+            .get(name)
+            .ok_or_else(|| anyhow::anyhow!("no parameter '{name}'"))?;
+        let param = &mut self.params[ind];
+        let value = value
+            .coerce(&param.value)
+            .ok_or_else(|| anyhow::anyhow!("'{name}' is a {}", param.value.type_name()))?
+            .clamp(&param.min, &param.max);
+        if value == param.value {
+            return Ok(None);
+        }
+        tracing::debug!("set {name} {:?} to {value:?}", param.value);
+        param.value = value;
+        Ok(Some(param.level))
+    }
+
+    /// set every parameter in the config, unknown or mistyped parameters are skipped,
+    /// returns the levels of all the parameters that changed or'ed together
+    pub fn apply(&mut self, config: &dynamic_reconfigure::Config) -> u32 {
+        let mut level = 0;
+        for (name, value) in config_values(config) {
+            match self.set(&name, value) {
+                Ok(Some(param_level)) => level |= param_level,
+                Ok(None) => {}
+                Err(err) => tracing::warn!("{err}"),
+            }
+        }
+        level
+    }
+
+    pub fn config(&self) -> dynamic_reconfigure::Config {
+        self.to_config(|param| &param.value)
+    }
+
+    pub fn description(&self) -> dynamic_reconfigure::ConfigDescription {
+        let mut group = dynamic_reconfigure::Group::default();
+        group.name = "Default".to_string();
+        for param in &self.params {
+            group.parameters.push(dynamic_reconfigure::ParamDescription {
+                name: param.name.clone(),
+                r#type: param.value.type_name().to_string(),
+                level: param.level,
+                description: param.description.clone(),
+                edit_method: "".to_string(),
+            });
+        }
+
+        dynamic_reconfigure::ConfigDescription {
+            groups: vec![group],
+            max: self.to_config(|param| &param.max),
+            min: self.to_config(|param| &param.min),
+            dflt: self.to_config(|param| &param.default),
+        }
+    }
+
+    fn to_config(&self, field: impl Fn(&Param) -> &Value) -> dynamic_reconfigure::Config {
+        let mut config = dynamic_reconfigure::Config::default();
+        for param in &self.params {
+            push_value(&mut config, param.name.clone(), field(param));
+        }
+
+        let mut group_state = dynamic_reconfigure::GroupState::default();
+        group_state.name = "Default".to_string();
+        group_state.state = true;
+        config.groups.push(group_state);
+        config
+    }
+}
+
+/// the values in a config by name
+pub fn config_values(config: &dynamic_reconfigure::Config) -> BTreeMap<String, Value> {
+    let bools = config.bools.iter().map(|p| (p.name.clone(), Value::Bool(p.value)));
+    let ints = config.ints.iter().map(|p| (p.name.clone(), Value::Int(p.value)));
+    let doubles = config.doubles.iter().map(|p| (p.name.clone(), Value::Double(p.value)));
+    let strs = config.strs.iter().map(|p| (p.name.clone(), Value::Str(p.value.clone())));
+    bools.chain(ints).chain(doubles).chain(strs).collect()
+}
+
+/// a config with no groups, for a set_parameters request
+pub fn values_config(values: &BTreeMap<String, Value>) -> dynamic_reconfigure::Config {
+    let mut config = dynamic_reconfigure::Config::default();
+    for (name, value) in values {
+        push_value(&mut config, name.clone(), value);
+    }
+    config
+}
+
+fn push_value(config: &mut dynamic_reconfigure::Config, name: String, value: &Value) {
+    match value {
+        Value::Bool(value) => config
+            .bools
+            .push(dynamic_reconfigure::BoolParameter { name, value: *value }),
+        Value::Int(value) => config
+            .ints
+            .push(dynamic_reconfigure::IntParameter { name, value: *value }),
+        Value::Double(value) => config
+            .doubles
+            .push(dynamic_reconfigure::DoubleParameter { name, value: *value }),
+        Value::Str(value) => config.strs.push(dynamic_reconfigure::StrParameter {
+            name,
+            value: value.clone(),
+        }),
+    }
+}
@@ -0,0 +1,102 @@
+//! dynamic reconfigure server for a ParamStore
+//!
+//! The set_parameters service can't await, so every new config is sent through a
+//! tokio watch channel to a task that publishes it on parameter_updates right away.
+//! If several arrive while a publish is in progress only the latest one goes out.
+
+use crate::dynamic_reconfigure;
+use crate::param_store::{ParamStore, Value};
+use roslibrust::ros1::{NodeHandle, Publisher, ServiceServer};
+use std::sync::{Arc, Mutex};
+use tokio::sync::watch;
+
+pub struct Server {
+    store: Arc<Mutex<ParamStore>>,
+    updates: Arc<watch::Sender<dynamic_reconfigure::Config>>,
+    // these need to stay alive for the service and the latched description
+    _service: ServiceServer,
+    _description_pub: Publisher<dynamic_reconfigure::ConfigDescription>,
+}
+
+impl Server {
+    pub async fn new(
+        nh: &NodeHandle,
+        node_name: &str,
+        store: ParamStore,
+    ) -> Result<Self, anyhow::Error> {
+        let latch = true;
+        let update_pub: Publisher<dynamic_reconfigure::Config> = nh
+            .advertise(&format!("{node_name}/parameter_updates"), 3, latch)
+            .await?;
+        let description_pub: Publisher<dynamic_reconfigure::ConfigDescription> = nh
+            .advertise(&format!("{node_name}/parameter_descriptions"), 1, latch)
+            .await?;
+        description_pub.publish(&store.description()).await?;
+
+        let (updates, mut updates_rx) = watch::channel(store.config());
+        let updates = Arc::new(updates);
+        let store = Arc::new(Mutex::new(store));
+
+        // starts by publishing the initial config, and finishes when the server is dropped
+        tokio::spawn(async move {
+            loop {
+                let config = updates_rx.borrow_and_update().clone();
+                if let Err(err) = update_pub.publish(&config).await {
+                    tracing::warn!("couldn't publish parameter_updates {err:?}");
+                }
+                if updates_rx.changed().await.is_err() {
+                    break;
+                }
+            }
+        });
+
+        let service_name = format!("{node_name}/set_parameters");
+        let store_copy = store.clone();
+        let updates_copy = updates.clone();
+        let server_fn = move |request: dynamic_reconfigure::ReconfigureRequest| {
+            tracing::debug!("{request:?}");
+            let config = {
+                let mut store = store_copy.lock().unwrap();
+                let level = store.apply(&request.config);
+                tracing::debug!("level {level}");
+                store.config()
+            };
+            // clients expect an update even if nothing changed
+            updates_copy.send_replace(config.clone());
+            Ok(dynamic_reconfigure::ReconfigureResponse { config })
+        };
+        let service = nh
+            .advertise_service::<dynamic_reconfigure::Reconfigure, _>(&service_name, server_fn)
+            .await?;
+        tracing::info!("serving dynamic reconfigure server on {service_name}");
+
+        Ok(Self {
+            store,
+            updates,
+            _service: service,
+            _description_pub: description_pub,
+        })
+    }
+
+    pub fn get(&self, name: &str) -> Option<Value> {
+        self.store.lock().unwrap().get(name).cloned()
+    }
+
+    /// change a value from the server side, clients get the new config right away
+    pub fn set(&self, name: &str, value: Value) -> Result<(), anyhow::Error> {
+        let config = {
+            let mut store = self.store.lock().unwrap();
+            if store.set(name, value)?.is_none() {
+                return Ok(());
+            }
+            store.config()
+        };
+        self.updates.send_replace(config);
+        Ok(())
+    }
+
+    /// receive every new config, from the service or from set()
+    pub fn subscribe(&self) -> watch::Receiver<dynamic_reconfigure::Config> {
+        self.updates.subscribe()
+    }
+}
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# Lucas Walter
+# Time building and updating the DrSingle gui for synthetic servers with
+# 10 to 2000 params, offscreen, without a ros master or a real server.
+#
+#   rosrun rqt_dr_single benchmark_dr_single.py --sizes 10 100 2000 --json out.json
+#
+# The dynamic reconfigure client is replaced with one that hands the
+# descriptions and configs straight to the plugin callbacks, and rosparams
+# come from a dict instead of the master.
+# Memory is the python allocations (tracemalloc) and the change in the
+# resident size of the process, which includes qt.
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import rospy  # noqa: E402
+import rqt_dr_single.client_registry  # noqa: E402
+from python_qt_binding.QtWidgets import QApplication  # noqa: E402
+from rqt_dr_single.dr_single import DrSingle  # noqa: E402
+
+params = {}
+
+
+def get_param(name, default=None):
+    return params.get(name, default)
+
+
+class FakeContext():
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def serial_number(self):
+        return 1
+
+    def argv(self):
+        return ['--quiet']
+
+    def add_widget(self, widget):
+        widget.resize(self.width, self.height)
+        widget.show()
+
+
+# no saved settings, like a new perspective
+class FakeSettings():
+    def contains(self, key):
+        return False
+
+    def value(self, key):
+        return None
+
+
+# Stands in for dynamic_reconfigure.client.Client, the server accepts every
+# change and sends the resulting config back like parameter_updates would
+class FakeClient():
+    def __init__(self, server_name, timeout=None, config_callback=None, description_callback=None):
+        self.server_name = server_name
+        self.config_callback = config_callback
+        self.description_callback = description_callback
+        self.config = {}
+
+    def update_configuration(self, changes):
+        self.config.update(changes)
+        self.config_callback(dict(self.config))
+        return dict(self.config)
+
+    def close(self):
+        pass
+
+
+def make_enum(num):
+    enums = []
+    for i in range(num):
+        enums.append({'name': 'choice{}'.format(i), 'type': 'int', 'value': i,
+                      'srcline': 0, 'srcfile': 'benchmark.cfg', 'description': '',
+                      'ctype': 'int', 'cconsttype': 'const int'})
+    return str({'enum': enums, 'enum_description': 'synthetic enum'})
+
+
+# params cycle through double, int, enum, bool and str
+def make_description(num_params):
+    edit_method = make_enum(8)
+    description = []
+    for i in range(num_params):
+        kind = i % 5
+        param = {'name': 'param_{:04d}'.format(i), 'level': 1, 'description': 'param {}'.format(i),
+                 'edit_method': ''}
+        if kind == 0:
+            param.update({'type': 'double', 'default': 0.5, 'min': -10.0, 'max': 10.0})
+        elif kind == 1:
+            param.update({'type': 'int', 'default': 5, 'min': 0, 'max': 100})
+        elif kind == 2:
+            param.update({'type': 'int', 'default': 0, 'min': 0, 'max': 7, 'edit_method': edit_method})
+        elif kind == 3:
+            param.update({'type': 'bool', 'default': False, 'min': False, 'max': True})
+        else:
+            param.update({'type': 'str', 'default': 'text', 'min': '', 'max': ''})
+        description.append(param)
+    return description
+
+
+def make_config(description, step, fraction):
+    config = {}
+    for i, param in enumerate(description):
+        changed = (i % max(int(1.0 / fraction), 1)) == 0 if fraction > 0.0 else False
+        offset = step if changed else 0
+        if param['type'] == 'double':
+            value = param['min'] + (param['max'] - param['min']) * ((offset * 7 + i) % 100) / 100.0
+        elif param['type'] == 'int':
+            value = param['min'] + (offset + i) % (param['max'] - param['min'] + 1)
+        elif param['type'] == 'bool':
+            value = (offset + i) % 2 == 0
+        else:
+            value = 'text {}'.format(offset)
+        config[param['name']] = value
+    return config
+
+
+def rss_kb():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 1024.0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def run(app, num_params, args):
+    server_name = '/benchmark_{}'.format(num_params)
+    params.clear()
+    params['~server'] = server_name
+    description = make_description(num_params)
+    result = {'params': num_params}
+
+    rss0 = rss_kb()
+    tracemalloc.start()
+    t0 = time.time()
+    plugin = DrSingle(FakeContext(args.width, args.height))
+    # rqt restores the settings right after init, which connects to the server
+    plugin.restore_settings(FakeSettings(), FakeSettings())
+    app.processEvents()
+    t1 = time.time()
+    client = plugin.client.client
+    client.config = make_config(description, 0, 0.0)
+    client.description_callback(description)
+    client.config_callback(dict(client.config))
+    t2 = time.time()
+    # the editors for the visible rows and the first config are created from queued events
+    while plugin.refresh_pending or plugin.config_timer.isActive():
+        app.processEvents()
+    app.processEvents()
+    t3 = time.time()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result['init_ms'] = (t1 - t0) * 1000.0
+    result['description_ms'] = (t2 - t1) * 1000.0
+    result['editors_ms'] = (t3 - t2) * 1000.0
+    result['build_ms'] = (t3 - t1) * 1000.0
+    result['editors'] = len(plugin.editors)
+    result['python_peak_kb'] = peak / 1024.0
+    result['rss_kb'] = rss_kb() - rss0
+
+    # every param changes in every update, and then only a few of them
+    for label, fraction in [('all', 1.0), ('few', 0.01)]:
+        plugin.update_config(make_config(description, 0, 0.0))
+        durations = []
+        for step in range(1, args.updates + 1):
+            config = make_config(description, step, fraction)
+            t0 = time.time()
+            plugin.update_config(config)
+            durations.append((time.time() - t0) * 1000.0)
+        result['update_{}_mean_ms'.format(label)] = sum(durations) / len(durations)
+        result['update_{}_p99_ms'.format(label)] = percentile(durations, 0.99)
+
+    # a burst of configs from the server is coalesced into one apply per frame
+    num_applies = plugin.redraws.count
+    t0 = time.time()
+    for step in range(args.updates):
+        client.config_callback(make_config(description, step, 1.0))
+    while plugin.config_timer.isActive() or plugin.pending_config:
+        app.processEvents()
+        time.sleep(0.001)
+    result['burst_ms'] = (time.time() - t0) * 1000.0
+    result['burst_applies'] = plugin.redraws.count - num_applies
+
+    plugin.shutdown_plugin()
+    plugin._widget.close()
+    plugin._widget.deleteLater()
+    app.processEvents()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the rqt_dr_single gui offscreen")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500, 1000, 2000])
+    parser.add_argument('--updates', type=int, default=100, help="configs applied per size")
+    parser.add_argument('--width', type=int, default=670)
+    parser.add_argument('--height', type=int, default=800)
+    parser.add_argument('--json', default=None, help="write the results to this file")
+    parser.add_argument('--max-build-ms', type=float, default=None,
+                        help="exit with an error if building any size takes longer")
+    parser.add_argument('--max-update-ms', type=float, default=None,
+                        help="exit with an error if the mean time to apply a full config is longer")
+    args = parser.parse_args(rospy.myargv()[1:])
+
+    rospy.get_param = get_param
+    rqt_dr_single.client_registry.Client = FakeClient
+    app = QApplication(sys.argv[:1])
+
+    columns = ['params', 'build_ms', 'editors', 'python_peak_kb', 'rss_kb',
+               'update_all_mean_ms', 'update_few_mean_ms', 'burst_ms', 'burst_applies']
+    print(" ".join("{:>18}".format(column) for column in columns))
+    results = []
+    for num_params in args.sizes:
+        result = run(app, num_params, args)
+        results.append(result)
+        print(" ".join("{:>18.2f}".format(result[column]) for column in columns))
+
+    if args.json is not None:
+        with open(args.json, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+    failed = False
+    for result in results:
+        if args.max_build_ms is not None and result['build_ms'] > args.max_build_ms:
+            print("{} params took {:0.1f}ms to build, more than {:0.1f}ms".format(
+                  result['params'], result['build_ms'], args.max_build_ms))
+            failed = True
+        if args.max_update_ms is not None and result['update_all_mean_ms'] > args.max_update_ms:
+            print("{} params took {:0.1f}ms to update, more than {:0.1f}ms".format(
+                  result['params'], result['update_all_mean_ms'], args.max_update_ms))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# Lucas Walter
+# Share one dynamic reconfigure client per server among all the panels
+# in a process, so several panels on the same server don't each subscribe
+# to its descriptions and updates and deserialize every message separately.
+
+import rospy
+import threading
+
+from dynamic_reconfigure.client import Client
+
+registry = None
+registry_lock = threading.Lock()
+
+
+def get_registry():
+    global registry
+    with registry_lock:
+        if registry is None:
+            registry = ClientRegistry()
+        return registry
+
+
+class SharedClient():
+    # The callbacks of every panel using this server are called from the
+    # callbacks of the one client, panels added later immediately get
+    # the latest description and config.
+    def __init__(self, server_name, timeout):
+        self.server_name = server_name
+        self.lock = threading.Lock()
+        # (config_callback, description_callback)
+        self.subscribers = []
+        self.config = None
+        self.description = None
+        self.client = Client(server_name, timeout=timeout,
+                             config_callback=self.config_callback,
+                             description_callback=self.description_callback)
+
+    def add(self, config_callback, description_callback):
+        with self.lock:
+            self.subscribers.append((config_callback, description_callback))
+            config = self.config
+            description = self.description
+        if description is not None:
+            description_callback(description)
+        if config is not None:
+            config_callback(config)
+
+    # returns how many subscribers are left
+    def remove(self, config_callback, description_callback):
+        with self.lock:
+            if (config_callback, description_callback) in self.subscribers:
+                self.subscribers.remove((config_callback, description_callback))
+            return len(self.subscribers)
+
+    def config_callback(self, config):
+        with self.lock:
+            self.config = config
+            subscribers = list(self.subscribers)
+        for config_callback, _ in subscribers:
+            config_callback(config)
+
+    def description_callback(self, description):
+        with self.lock:
+            self.description = description
+            subscribers = list(self.subscribers)
+        for _, description_callback in subscribers:
+            description_callback(description)
+
+    def update_configuration(self, changes):
+        return self.client.update_configuration(changes)
+
+    def close(self):
+        self.client.close()
+
+
+class ClientRegistry():
+    def __init__(self):
+        self.lock = threading.Lock()
+        # server name -> SharedClient
+        self.clients = {}
+
+    # Raises whatever Client raises if there is no server to connect to
+    def acquire(self, server_name, config_callback, description_callback, timeout=0.2):
+        with self.lock:
+            shared = self.clients.get(server_name)
+            if shared is None:
+                shared = SharedClient(server_name, timeout)
+                self.clients[server_name] = shared
+                rospy.logdebug("new client for {}, {} servers".format(server_name, len(self.clients)))
+            shared.add(config_callback, description_callback)
+            return shared
+
+    # the client is closed once nothing is using it
+    def release(self, shared, config_callback, description_callback):
+        with self.lock:
+            if shared.remove(config_callback, description_callback) > 0:
+                return
+            if self.clients.get(shared.server_name) is shared:
+                del self.clients[shared.server_name]
+        rospy.logdebug("closing client for {}".format(shared.server_name))
+        shared.close()
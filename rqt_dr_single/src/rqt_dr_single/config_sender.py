@@ -0,0 +1,130 @@
+# Lucas Walter
+# Send edits to a dynamic reconfigure server from one persistent thread.
+# Edits are merged into an outbox where the latest value of each param wins,
+# so anything edited while a call is in flight goes out together in the next one,
+# and the gui never waits on the network.
+
+import threading
+import time
+
+
+class ConfigSender():
+    # done_fn(delta, config, elapsed, waited), failed_fn(delta, exception)
+    # and rejected_fn(delta, exception) are called from the sender thread,
+    # so in a gui they should only emit signals.
+    # elapsed is how long the call took, waited is how long the oldest edit
+    # in it waited in the outbox before that.
+    # is_rejection(exception) tells a server that refused the values apart from
+    # one that couldn't be reached: rejected edits are dropped and the client kept,
+    # anything else keeps the edits and waits for a new client.
+    def __init__(self, done_fn=None, failed_fn=None, rejected_fn=None, is_rejection=None):
+        self.done_fn = done_fn
+        self.failed_fn = failed_fn
+        self.rejected_fn = rejected_fn
+        self.is_rejection = is_rejection
+
+        self.lock = threading.Condition()
+        self.client = None
+        self.outbox = {}
+        # when the oldest edit in the outbox was made
+        self.first_stamp = None
+        self.in_flight = False
+        self.is_shutdown = False
+
+        self.num_edits = 0
+        # edits that replaced a value still waiting in the outbox
+        self.num_merged = 0
+        self.num_calls = 0
+        self.num_failed = 0
+        self.num_rejected = 0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # None pauses sending, whatever is in the outbox waits for the next client
+    def set_client(self, client):
+        with self.lock:
+            self.client = client
+            self.lock.notify()
+
+    def send(self, delta):
+        with self.lock:
+            if not self.outbox:
+                self.first_stamp = time.time()
+            for key, value in delta.items():
+                self.num_edits += 1
+                if key in self.outbox:
+                    self.num_merged += 1
+                self.outbox[key] = value
+            self.lock.notify()
+
+    # drop unsent edits, e.g. when switching to a different server
+    def clear(self):
+        with self.lock:
+            self.outbox = {}
+
+    def stats(self):
+        with self.lock:
+            return {
+                'edits': self.num_edits,
+                'merged': self.num_merged,
+                'calls': self.num_calls,
+                'failed': self.num_failed,
+                'rejected': self.num_rejected,
+                'pending': len(self.outbox),
+                'in_flight': self.in_flight,
+            }
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.is_shutdown and (not self.outbox or self.client is None):
+                    self.lock.wait()
+                if self.is_shutdown:
+                    return
+                client = self.client
+                delta = self.outbox
+                stamp = self.first_stamp
+                self.outbox = {}
+                self.in_flight = True
+                self.num_calls += 1
+
+            t0 = time.time()
+            try:
+                config = client.update_configuration(delta)
+            except Exception as ex:
+                if self.is_rejection is not None and self.is_rejection(ex):
+                    with self.lock:
+                        self.in_flight = False
+                        self.num_rejected += 1
+                        # newer edits of the same params are still worth sending
+                        delta = dict([(key, value) for key, value in delta.items()
+                                      if key not in self.outbox])
+                    if self.rejected_fn is not None:
+                        self.rejected_fn(delta, ex)
+                    continue
+                with self.lock:
+                    self.in_flight = False
+                    self.num_failed += 1
+                    # put the edits back, under any newer ones made in the meantime,
+                    # and wait for a new client
+                    if not self.outbox or stamp < self.first_stamp:
+                        self.first_stamp = stamp
+                    for key, value in delta.items():
+                        self.outbox.setdefault(key, value)
+                    if self.client is client:
+                        self.client = None
+                if self.failed_fn is not None:
+                    self.failed_fn(delta, ex)
+                continue
+
+            with self.lock:
+                self.in_flight = False
+            if self.done_fn is not None:
+                self.done_fn(delta, config, time.time() - t0, t0 - stamp)
+
+    def shutdown(self):
+        with self.lock:
+            self.is_shutdown = True
+            self.lock.notify()
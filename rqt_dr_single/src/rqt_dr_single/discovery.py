@@ -0,0 +1,125 @@
+# Lucas Walter
+# Find dynamic reconfigure servers from one background thread per process,
+# shared by every panel, instead of each panel scanning the whole topic list
+# from the master on the gui thread.
+
+import rospy
+import threading
+import time
+
+discovery = None
+discovery_lock = threading.Lock()
+
+
+# the process wide discovery, the panel that wants the most frequent
+# updates sets the period
+def get_discovery(period=2.0):
+    global discovery
+    with discovery_lock:
+        if discovery is None:
+            discovery = ServerDiscovery(period)
+        elif period < discovery.period:
+            discovery.set_period(period)
+        return discovery
+
+
+class ServerDiscovery():
+    # callback(added, removed) gets sorted lists of server names whenever
+    # they change, called from the discovery thread.
+    # The master is only polled while there are subscribers.
+    def __init__(self, period=2.0):
+        self.period = period
+        self.lock = threading.Condition()
+        # None until the first successful poll
+        self.servers = None
+        self.callbacks = []
+        self.refresh_requested = False
+        self.is_shutdown = False
+        self.num_polls = 0
+        self.poll_duration = 0.0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # the callback first gets every server already known
+    def subscribe(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+            servers = self.servers
+            self.lock.notify()
+        if servers:
+            callback(sorted(servers), [])
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def get_servers(self):
+        with self.lock:
+            if self.servers is None:
+                return []
+            return sorted(self.servers)
+
+    # poll now instead of waiting for the rest of the period
+    def refresh(self):
+        with self.lock:
+            self.refresh_requested = True
+            self.lock.notify()
+
+    def set_period(self, period):
+        with self.lock:
+            self.period = period
+            self.lock.notify()
+
+    def poll(self):
+        t0 = time.time()
+        try:
+            topics = rospy.get_published_topics()
+        except Exception as ex:
+            # TODO(lucasw) the roscore going down ends up here with a socket error
+            rospy.logdebug("couldn't get topics from the master: {}".format(ex))
+            return None
+        servers = set()
+        for topic, topic_type in topics:
+            if topic_type == 'dynamic_reconfigure/ConfigDescription':
+                servers.add(topic[:topic.rfind('/')])
+        self.poll_duration = time.time() - t0
+        self.num_polls += 1
+        return servers
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.is_shutdown and not self.callbacks:
+                    self.lock.wait()
+                if self.is_shutdown:
+                    return
+                self.refresh_requested = False
+
+            servers = self.poll()
+            if servers is not None:
+                with self.lock:
+                    old_servers = self.servers if self.servers is not None else set()
+                    self.servers = servers
+                    callbacks = list(self.callbacks)
+                added = sorted(servers - old_servers)
+                removed = sorted(old_servers - servers)
+                if added or removed:
+                    rospy.logdebug("servers: {} added {} removed, took {:0.3f}s".format(
+                                   len(added), len(removed), self.poll_duration))
+                    for callback in callbacks:
+                        try:
+                            callback(added, removed)
+                        except Exception as ex:
+                            rospy.logerr("server discovery callback failed: {}".format(ex))
+
+            with self.lock:
+                if not self.is_shutdown and not self.refresh_requested:
+                    self.lock.wait(self.period)
+
+    def shutdown(self):
+        with self.lock:
+            self.is_shutdown = True
+            self.lock.notify()
@@ -1,11 +1,13 @@
 # connect to a single dynamic reconfigure server
+import bisect
+import dynamic_reconfigure
 import os
+import re
 import rospkg
 import rospy
 import threading
 import time
 
-from dynamic_reconfigure.client import Client
 from functools import partial
 from qt_gui.plugin import Plugin
 from python_qt_binding import loadUi
@@ -14,20 +16,39 @@ from python_qt_binding import loadUi
 # from python_qt_binding.QtGui import QCheckBox, QGridLayout, QHBoxLayout,
 # QLabel, QLineEdit, QVBoxLayout, QSlider, QWidget
 # this works in qt5 kinetic
-from python_qt_binding.QtCore import QTimer, Signal
-from python_qt_binding.QtGui import QDoubleValidator, QIntValidator
-from python_qt_binding.QtWidgets import QCheckBox, QComboBox, QGridLayout
+from python_qt_binding.QtCore import QEvent, QModelIndex, QPersistentModelIndex, QTimer, Signal
+from python_qt_binding.QtGui import QDoubleValidator, QIntValidator, QStandardItem, QStandardItemModel
+from python_qt_binding.QtWidgets import QCheckBox, QComboBox, QHeaderView, QTableView
 from python_qt_binding.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QPushButton, QVBoxLayout, QSlider, QWidget
 
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from python_qt_binding import QtCore
+from rqt_dr_single.client_registry import get_registry
+from rqt_dr_single.config_sender import ConfigSender
+from rqt_dr_single.discovery import get_discovery
+from rqt_dr_single.edit_method import get_enum
+from rqt_dr_single.stats import Samples
 from std_msgs.msg import Int32
 
 
+# The server got the request and refused it, rather than not being reachable.
+# rospy raises ServiceException for both, only a refusal by the handler
+# comes with this message.
+def is_rejection(ex):
+    if isinstance(ex, dynamic_reconfigure.DynamicReconfigureParameterException):
+        return True
+    return isinstance(ex, rospy.ServiceException) and \
+        str(ex).startswith("service cannot process request")
+
+
 class DrSingle(Plugin):
     do_update_description = QtCore.pyqtSignal(list)
-    do_update_config = QtCore.pyqtSignal(dict)
+    do_update_config = QtCore.pyqtSignal()
     do_update_checkbox = QtCore.pyqtSignal(bool)
-    do_update_dr = QtCore.pyqtSignal()
+    do_update_servers = QtCore.pyqtSignal(list, list)
+    do_send_done = QtCore.pyqtSignal(int, float, float)
+    do_send_failed = QtCore.pyqtSignal(str)
+    do_send_rejected = QtCore.pyqtSignal(list, str)
 
     def __init__(self, context):
         super(DrSingle, self).__init__(context)
@@ -67,16 +88,61 @@ class DrSingle(Plugin):
         # Add widget to the user interface
         context.add_widget(self._widget)
         # self.parent_layout = self._widget.findChild(QVBoxLayout, 'vertical_layout')
-        self.layout = self._widget.findChild(QGridLayout, 'grid_layout')
-        self.changed_value = {}
+        # Each param is a row of name and value text in the model, editor widgets
+        # are only created for the rows that are in view.
+        self.view = self._widget.findChild(QTableView, 'param_view')
+        self.model = QStandardItemModel(0, 2, self._widget)
+        self.view.setModel(self.model)
+        # fixed height rows let the view find the visible rows without
+        # measuring every one
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(28)
+        self.view.setColumnWidth(0, 180)
+        # how many rows past the visible ones keep their editors
+        self.editor_margin = 10
+        self.refresh_pending = False
+        self.view.verticalScrollBar().valueChanged.connect(self.schedule_refresh)
+        self.view.viewport().installEventFilter(self)
+
+        self.filter_text = ''
+        self.filter_line_edit = self._widget.findChild(QLineEdit, 'filter_line_edit')
+        self.filter_line_edit.textChanged.connect(self.filter_changed)
+        # edits are sent from a thread that keeps the latest value of each param
+        # until the server can take them
+        self.sender = ConfigSender(done_fn=self.send_done_callback,
+                                   failed_fn=self.send_failed_callback,
+                                   rejected_fn=self.send_rejected_callback,
+                                   is_rejection=is_rejection)
 
         self.lock = threading.Lock()
 
+        # configs from the server are merged into this until the gui thread
+        # gets to them, and then applied at most once per frame
+        self.pending_lock = threading.Lock()
+        self.pending_config = {}
+        frame_rate = rospy.get_param("~frame_rate", 60.0)
+        self.config_timer = QTimer(self)
+        self.config_timer.setSingleShot(True)
+        self.config_timer.setInterval(int(1000.0 / frame_rate))
+        self.config_timer.timeout.connect(self.apply_pending_config)
+        self.num_configs = 0
+        # configs that arrived while an earlier one was still waiting to be applied
+        self.num_configs_merged = 0
+
+        # from an edit to the server responding with the resulting config,
+        # which is the same config it publishes on parameter_updates
+        self.round_trips = Samples()
+        # applying a config to the model and editors, not including qt painting
+        self.redraws = Samples()
+
         self.reset()
         self.do_update_description.connect(self.update_description)
-        self.do_update_config.connect(self.update_config)
+        self.do_update_config.connect(self.schedule_config)
         self.do_update_checkbox.connect(self.update_checkbox)
-        self.do_update_dr.connect(self.update_dr)
+        self.do_update_servers.connect(self.servers_changed)
+        self.do_send_done.connect(self.send_done)
+        self.do_send_failed.connect(self.send_failed)
+        self.do_send_rejected.connect(self.send_rejected)
         self.div = 100.0
 
         server_name = rospy.get_param("~server", None)
@@ -93,6 +159,19 @@ class DrSingle(Plugin):
 
         self.hide_dropdown = rospy.get_param("~hide_dropdown", None)
 
+        # a row of timing stats under the params, also published as diagnostics
+        self.show_stats = rospy.get_param("~show_stats", False)
+        self.stats_label = self._widget.findChild(QLabel, 'stats_label')
+        self.stats_label.setVisible(self.show_stats)
+        if self.show_stats:
+            self.diagnostics_pub = rospy.Publisher("/diagnostics", DiagnosticArray, queue_size=2)
+            self.stats_timer = QTimer(self)
+            self.stats_timer.timeout.connect(self.update_stats)
+            self.stats_timer.start(1000)
+        # regular expressions for the param names this panel shows
+        self.set_selection(rospy.get_param("~include", None),
+                           rospy.get_param("~exclude", None))
+
         self.refresh_button = self._widget.findChild(QPushButton, 'refresh_button')
         self.refresh_button.pressed.connect(self.update_topic_list)
 
@@ -101,67 +180,90 @@ class DrSingle(Plugin):
         self.connected_checkbox.setEnabled(False)
         self.server_combobox = self._widget.findChild(QComboBox, 'server_combobox')
         self.server_combobox.currentIndexChanged.connect(self.server_changed)
+        # panels on the same server share one client
+        self.clients = get_registry()
         self.client = None
-        self.update_topic_list()
-
-        # try to connect to saved dr server
-        self.connect_dr()
-        # TODO(lucasw) can't use ros timers in guis, there might be a sim clock that
-        # is paused.  (How many other nodes in other projects are going to fail
-        # because of that?)
-        # self.update_timer = rospy.Timer(rospy.Duration(0.05), self.update_dr_configuration)
-        # TODO(lucasw) is this the right thread to be calling this?
-        # If this is qt then need to trigger a ros callback-
-        # can I do a single shot rospy.Timer with sim_clock paused?
-        # self.do_update_dr.emit()
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_dr_from_emit)
-        self.timer.start(100)
-
-    def update_dr_from_emit(self):
-        self.do_update_dr.emit()
-
-    def update_dr(self):
-        self.update_dr_configuration(None)
-        # TODO(lucasw) need to call this repeatedly, setup time callback here
-
+        # no connecting until restore_settings has applied the saved selection,
+        # otherwise the description builds rows for params that get hidden right after
+        self.settings_restored = False
+        self.auto_select = False
+        self.select_server_item()
+        # every panel in the process shares one poll of the master
+        self.discovery = get_discovery(rospy.get_param("~discovery_period", 2.0))
+        self.discovery.subscribe(self.servers_callback)
+
+    # the server list itself is kept up to date by servers_changed,
+    # refreshing only asks for it sooner
     def update_topic_list(self):
-        with self.lock:
-            server_name = self.server_name
-        # TODO(lucasw) if the roscore goes down, this throws a socket error
-        topics = rospy.get_published_topics()
-        self.server_combobox.currentIndexChanged.disconnect(self.server_changed)
-        self.server_combobox.clear()
-        rospy.logdebug(server_name)
-        if server_name is not None:
-            self.server_combobox.addItem(server_name)
-        dr_list = []
-        for topic in topics:
-            if topic[1] == 'dynamic_reconfigure/ConfigDescription':
-                new_server_name = topic[0][:topic[0].rfind('/')]
-                if new_server_name != server_name:
-                    dr_list.append(new_server_name)
-                # default to choosing the first one
-                # if server_name is None:
-                #     with self.lock:
-                #         self.server_name = server_name
-        dr_list.sort()
-        self.server_combobox.addItems(dr_list)
-        self.server_combobox.currentIndexChanged.connect(self.server_changed)
+        self.discovery.refresh()
+        self.select_server_item()
 
         # force the gui to be refreshed
         # self.client = None
         if self.client is None:
             self.connect_dr()
-        self.update_dr_configuration(None)
+
+    # the combobox is kept sorted
+    def insert_server_item(self, name):
+        items = [self.server_combobox.itemText(i) for i in range(self.server_combobox.count())]
+        ind = bisect.bisect_left(items, name)
+        self.server_combobox.insertItem(ind, name)
+        return ind
+
+    # make sure the current server is in the combobox and selected,
+    # even if it hasn't been discovered (yet)
+    def select_server_item(self):
+        with self.lock:
+            server_name = self.server_name
+        if server_name is None:
+            return
+        was_blocked = self.server_combobox.blockSignals(True)
+        ind = self.server_combobox.findText(server_name)
+        if ind < 0:
+            ind = self.insert_server_item(server_name)
+        self.server_combobox.setCurrentIndex(ind)
+        self.server_combobox.blockSignals(was_blocked)
+
+    # called from the discovery thread
+    def servers_callback(self, added, removed):
+        self.do_update_servers.emit(added, removed)
+
+    def servers_changed(self, added, removed):
+        with self.lock:
+            server_name = self.server_name
+        was_blocked = self.server_combobox.blockSignals(True)
+        for name in removed:
+            # the current server stays while it is gone, it may come back
+            if name == server_name:
+                continue
+            ind = self.server_combobox.findText(name)
+            if ind >= 0:
+                self.server_combobox.removeItem(ind)
+        for name in added:
+            if self.server_combobox.findText(name) < 0:
+                self.insert_server_item(name)
+        self.server_combobox.blockSignals(was_blocked)
+        rospy.logdebug("servers {} added {} removed".format(added, removed))
+
+        self.select_first_server()
+        if self.client is None and server_name in added:
+            self.connect_dr()
+
+    # with no server given, choose the first one that is discovered
+    def select_first_server(self):
+        if not self.auto_select or self.server_combobox.count() == 0:
+            return
+        self.auto_select = False
+        self.server_combobox.setCurrentIndex(0)
+        self.server_changed(0)
 
     def server_changed(self, index):
         new_server = self.server_combobox.currentText()
         rospy.loginfo(new_server)
         if self.server_name != new_server:
             self.server_name = new_server
-            self.client = None
-            self.changed_value = {}
+            self.release_client()
+            self.sender.clear()
             self.reset()
             self.refresh_button.click()
 
@@ -173,6 +275,8 @@ class DrSingle(Plugin):
         # TODO(lucasw) actually use the lock optionally
         with self.lock:
             rospy.logdebug("reset")
+            # removing the rows also deletes any editors in them
+            self.model.removeRows(0, self.model.rowCount())
             self.described = False
             self.widget = {}
             self.enum_values = {}
@@ -181,17 +285,26 @@ class DrSingle(Plugin):
             self.use_div = {}
             self.params = {}
             self.val_label = {}
-            self.config = None
-
-    def add_label(self, name, row):
-        # TODO(lucasw) don't really need this
-        return
-        val_label = QLabel()
-        val_label.setFixedWidth(90)
-        self.layout.addWidget(val_label, row, 2)
-        self.val_label[name] = val_label
-
-    def make_line_edit(self, name, row, vmin, vmax, double_not_int):
+            # param names in the order of the rows in the model
+            self.row_names = []
+            # param name -> the model item that shows the value as text
+            self.value_items = {}
+            # param name -> persistent index of the cell holding its editor,
+            # only rows near the visible part of the view have editors
+            self.editors = {}
+            # the latest value of every param, editors are created from these
+            self.values = {}
+            # params changed in the gui since the last config from the server,
+            # the next config has to be applied to them even if it has the same values
+            self.edited = set()
+            # the latest description and every value received, so rows can be
+            # rebuilt when the selection of params changes
+            self.description = None
+            self.config = {}
+        with self.pending_lock:
+            self.pending_config = {}
+
+    def make_line_edit(self, name, vmin, vmax, double_not_int):
         val_edit = QLineEdit()
         val_edit.setFixedWidth(100)
         # TODO(lucasw) have optional ability to break limits
@@ -205,7 +318,6 @@ class DrSingle(Plugin):
         self.connections[connection_name] = partial(self.text_changed,
                                                     name)
         val_edit.editingFinished.connect(self.connections[connection_name])
-        self.layout.addWidget(val_edit, row, 2)
         self.val_label[name] = val_edit
         return val_edit
 
@@ -216,213 +328,384 @@ class DrSingle(Plugin):
         if rospy.is_shutdown():
             return
         with self.lock:
+            self.description = description
             updated = self.update_description_inner(description)
+            if updated and self.config:
+                self.update_config_inner(self.config)
         if updated:
             rospy.loginfo("updated description")
-            if self.config:
-                self.update_config(self.config)
+            self.schedule_refresh()
+
+    # Only params matching include and not matching exclude get rows,
+    # the rest are dropped before anything is built for them
+    def set_selection(self, include, exclude):
+        self.include = include
+        self.exclude = exclude
+        self.include_re = self.compile_pattern(include)
+        self.exclude_re = self.compile_pattern(exclude)
+        if getattr(self, 'description', None) is not None:
+            self.update_description(self.description)
+
+    @staticmethod
+    def compile_pattern(pattern):
+        if not pattern:
+            return None
+        try:
+            return re.compile(pattern)
+        except re.error as ex:
+            rospy.logerr("bad param name pattern '{}': {}".format(pattern, ex))
+            return None
+
+    def selected(self, name):
+        if self.include_re is not None and self.include_re.search(name) is None:
+            return False
+        if self.exclude_re is not None and self.exclude_re.search(name) is not None:
+            return False
+        return True
+
+    # the parts of a param description that the widgets are built from,
+    # if none of these change the existing row can be kept
+    @staticmethod
+    def row_key(param):
+        return (param['name'], param['type'], param['min'], param['max'], param['edit_method'])
 
     #  -> bool:
     def update_description_inner(self, description):
-        # clear the layout
-        # rospy.loginfo("clearing layout " + str(self.layout.count()))
-        try:
-            for i in reversed(range(self.layout.count())):
-                layout = self.layout.itemAt(i).layout()
-                if layout:
-                    for j in reversed(range(layout.count())):
-                        layout.itemAt(j).widget().setParent(None)
-                    self.layout.itemAt(i).layout().setParent(None)
-                elif self.layout.itemAt(i).widget():
-                    self.layout.itemAt(i).widget().setParent(None)
-        except RuntimeError as ex:
-            rospy.logerr(ex)
-            return False
+        # Only rows that are new or have changed are rebuilt,
+        # a description identical to the current one (e.g. from reconnecting
+        # to the same server) doesn't touch the model.
+        # The rows are only names and text, editor widgets are created
+        # later for the rows that are scrolled into view.
         # TODO(lucasw) this has the min and max values and types from which to
         # generate the gui
         # But no group information
         # rospy.loginfo(description)
-        row = 0
+        params = []
         for param in description:
-            self.params[param['name']] = param
-            rospy.logdebug(param['name'] + " " + str(param['min']) + " "
-                           + str(param['max']) + " " + str(param['type']))
-
-            label = QLabel()
-            label.setText(param['name'])
-            self.layout.addWidget(label, row, 0)
-
-            widget = None
-            if param['type'] == 'str':
-                widget = QLineEdit()
-                widget.setText(param['default'])
-                widget.editingFinished.connect(partial(self.text_resend, param['name']))
-                self.add_label(param['name'], row)
-                self.layout.addWidget(widget, row, 1)
-            elif param['type'] == 'bool':
-                widget = QCheckBox()
-                widget.setChecked(param['default'])
-                self.layout.addWidget(widget, row, 1)
-                self.use_div[param['name']] = False
-                self.connections[param['name']] = partial(self.value_changed, param['name'])
-                widget.toggled.connect(self.connections[param['name']])
-                self.add_label(param['name'], row)
-                self.layout.addWidget(widget, row, 1)
-            elif param['type'] == 'double':
-                # TODO(lucasw) also have qspinbox or qdoublespinbox
-                layout = QHBoxLayout()
-                widget = QSlider()
-                slider_val = 0.0
-                if param['min'] != param['max']:
-                    slider_val = self.div * (param['default'] - param['min']) / (param['max'] - param['min'])
-                widget.setValue(int(slider_val))
-                widget.setOrientation(QtCore.Qt.Horizontal)
-                widget.setMinimum(0)
-                widget.setMaximum(int(self.div))
-                self.use_div[param['name']] = True
-                self.connections[param['name']] = partial(self.value_changed,
-                                                          param['name'])
-                widget.valueChanged.connect(self.connections[param['name']])
-                layout.addWidget(widget)
-
-                line_edit = self.make_line_edit(param['name'], row,
-                                                param['min'], param['max'],
-                                                double_not_int=True)
-                layout.addWidget(line_edit)
-                self.layout.addLayout(layout, row, 1)
-
-            elif param['type'] == 'int':
-                # TODO(lucasw) also have qspinbox or qdoublespinbox
-                if param['edit_method'] == '':
-                    layout = QHBoxLayout()
-                    widget = QSlider()
-                    widget.setValue(param['default'])
-                    widget.setOrientation(QtCore.Qt.Horizontal)
-                    widget.setMinimum((param['min']))
-                    widget.setMaximum((param['max']))
-                    self.connections[param['name']] = partial(self.value_changed, param['name'])
-                    widget.valueChanged.connect(self.connections[param['name']])
-                    layout.addWidget(widget)
-                    line_edit = self.make_line_edit(param['name'], row,
-                                                    param['min'], param['max'],
-                                                    double_not_int=False)
-                    layout.addWidget(line_edit)
-                    self.layout.addLayout(layout, row, 1)
-                else:  # enum
-                    widget = QComboBox()
-                    # edit_method is actually a long string that has to be interpretted
-                    # back into a list
-                    enums = eval(param['edit_method'])['enum']
-                    self.enum_values[param['name']] = {}
-                    self.enum_inds[param['name']] = {}
-                    count = 0
-                    for enum in enums:
-                        name = enum['name'] + ' (' + str(enum['value']) + ')'
-                        widget.addItem(name)
-                        self.enum_values[param['name']][count] = enum['value']
-                        self.enum_inds[param['name']][enum['value']] = count
-                        count += 1
-                        # print(count, enum)
-                    self.connections[param['name']] = partial(self.enum_changed,
-                                                              param['name'])
-                    widget.currentIndexChanged.connect(self.connections[param['name']])
-                    self.add_label(param['name'], row)
-                    self.layout.addWidget(widget, row, 1)
-                self.use_div[param['name']] = False
-            else:
+            if not self.selected(param['name']):
+                continue
+            if param['type'] not in ['str', 'bool', 'double', 'int']:
                 rospy.logerr(param)
-
-            if widget:
-                self.widget[param['name']] = widget
-                # val_label.setText("0")
-                # self.layout.addWidget(val_label, row, 2)
-                row += 1
+                continue
+            params.append(param)
+        new_params = {}
+        for param in params:
+            new_params[param['name']] = param
+        try:
+            num_removed = 0
+            for row in reversed(range(len(self.row_names))):
+                name = self.row_names[row]
+                if name not in new_params or self.row_key(new_params[name]) != self.row_key(self.params[name]):
+                    self.remove_row(row)
+                    num_removed += 1
+
+            # the kept rows have to already be in the new order,
+            # otherwise start over
+            kept = [param['name'] for param in params if param['name'] in self.params]
+            if kept != self.row_names:
+                num_removed += len(self.row_names)
+                for row in reversed(range(len(self.row_names))):
+                    self.remove_row(row)
+
+            num_added = 0
+            for row, param in enumerate(params):
+                name = param['name']
+                self.params[name] = param
+                if row < len(self.row_names) and self.row_names[row] == name:
+                    continue
+                self.insert_row(row, param)
+                num_added += 1
+        except RuntimeError as ex:
+            rospy.logerr(ex)
+            return False
+        rospy.logdebug("description: {} rows, {} added {} removed".format(
+                       len(self.row_names), num_added, num_removed))
         self.described = True
         return True
 
+    def insert_row(self, row, param):
+        name = param['name']
+        name_item = QStandardItem(name)
+        name_item.setEditable(False)
+        name_item.setToolTip(param['description'])
+        value_item = QStandardItem()
+        value_item.setEditable(False)
+        if name in self.values:
+            value_item.setText(self.format_value(name, self.values[name]))
+        self.model.insertRow(row, [name_item, value_item])
+        self.row_names.insert(row, name)
+        self.value_items[name] = value_item
+        self.view.setRowHidden(row, not self.matches_filter(name))
+
+    def remove_row(self, row):
+        name = self.row_names.pop(row)
+        self.destroy_editor(name)
+        self.model.removeRow(row)
+        self.value_items.pop(name, None)
+        self.params.pop(name, None)
+        self.values.pop(name, None)
+
+    def build_editor(self, row):
+        name = self.row_names[row]
+        param = self.params[name]
+        rospy.logdebug(name + " " + str(param['min']) + " "
+                       + str(param['max']) + " " + str(param['type']))
+
+        # the editor covers the value text in the cell
+        editor = QWidget()
+        editor.setAutoFillBackground(True)
+        layout = QHBoxLayout(editor)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        if param['type'] == 'str':
+            widget = QLineEdit()
+            widget.setText(param['default'])
+            widget.editingFinished.connect(partial(self.text_resend, name))
+            layout.addWidget(widget)
+        elif param['type'] == 'bool':
+            widget = QCheckBox()
+            widget.setChecked(param['default'])
+            self.use_div[name] = False
+            self.connections[name] = partial(self.value_changed, name)
+            widget.toggled.connect(self.connections[name])
+            layout.addWidget(widget)
+        elif param['type'] == 'double':
+            # TODO(lucasw) also have qspinbox or qdoublespinbox
+            widget = QSlider()
+            slider_val = 0.0
+            if param['min'] != param['max']:
+                slider_val = self.div * (param['default'] - param['min']) / (param['max'] - param['min'])
+            widget.setValue(int(slider_val))
+            widget.setOrientation(QtCore.Qt.Horizontal)
+            widget.setMinimum(0)
+            widget.setMaximum(int(self.div))
+            self.use_div[name] = True
+            self.connections[name] = partial(self.value_changed, name)
+            widget.valueChanged.connect(self.connections[name])
+            layout.addWidget(widget)
+
+            line_edit = self.make_line_edit(name, param['min'], param['max'],
+                                            double_not_int=True)
+            layout.addWidget(line_edit)
+        else:  # int
+            # TODO(lucasw) also have qspinbox or qdoublespinbox
+            # an edit_method that can't be parsed falls back to a slider
+            enum = None
+            if param['edit_method'] != '':
+                enum = get_enum(param['edit_method'])
+            if enum is None:
+                widget = QSlider()
+                widget.setValue(param['default'])
+                widget.setOrientation(QtCore.Qt.Horizontal)
+                widget.setMinimum((param['min']))
+                widget.setMaximum((param['max']))
+                self.connections[name] = partial(self.value_changed, name)
+                widget.valueChanged.connect(self.connections[name])
+                layout.addWidget(widget)
+                line_edit = self.make_line_edit(name, param['min'], param['max'],
+                                                double_not_int=False)
+                layout.addWidget(line_edit)
+            else:  # enum
+                widget = QComboBox()
+                # the parsed tables are shared with every other row and panel
+                # with the same edit_method
+                widget.addItems(enum.labels)
+                self.enum_values[name] = enum.values
+                self.enum_inds[name] = enum.indices
+                self.connections[name] = partial(self.enum_changed, name)
+                widget.currentIndexChanged.connect(self.connections[name])
+                layout.addWidget(widget)
+            self.use_div[name] = False
+
+        self.widget[name] = widget
+        if name in self.values:
+            self.set_editor_value(name, self.values[name])
+        index = self.model.index(row, 1)
+        self.view.setIndexWidget(index, editor)
+        self.editors[name] = QPersistentModelIndex(index)
+
+    def destroy_editor(self, name):
+        index = self.editors.pop(name, None)
+        if index is None:
+            return
+        # the view deletes the editor widget when it is replaced
+        if index.isValid():
+            self.view.setIndexWidget(QModelIndex(index), None)
+        for table in [self.widget, self.val_label, self.use_div,
+                      self.enum_values, self.enum_inds]:
+            table.pop(name, None)
+        self.connections.pop(name, None)
+        self.connections.pop(name + "_line_edit", None)
+
+    def matches_filter(self, name):
+        return self.filter_text == '' or self.filter_text in name.lower()
+
+    def filter_changed(self, text):
+        with self.lock:
+            self.filter_text = text.strip().lower()
+            for row, name in enumerate(self.row_names):
+                self.view.setRowHidden(row, not self.matches_filter(name))
+        self.schedule_refresh()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Resize:
+            self.schedule_refresh()
+        return False
+
+    # scrolling and resizing can happen many times before the gui
+    # gets around to redrawing, only refresh the editors once for all of them
+    def schedule_refresh(self, *args):
+        if self.refresh_pending:
+            return
+        self.refresh_pending = True
+        QTimer.singleShot(0, self.refresh_editors)
+
+    # create editors for the rows that are visible and delete the ones
+    # that are far enough out of view, so the number of widgets depends on the
+    # height of the view rather than the number of params
+    def refresh_editors(self):
+        self.refresh_pending = False
+        with self.lock:
+            num_rows = len(self.row_names)
+            # the view gets a resize event when it is shown
+            if num_rows == 0 or not self.view.isVisible():
+                return
+            first = self.view.rowAt(0)
+            last = self.view.rowAt(self.view.viewport().height() - 1)
+            if first < 0:
+                first = 0
+            if last < 0:
+                last = num_rows - 1
+            keep = set()
+            for row in range(max(first - self.editor_margin, 0),
+                             min(last + self.editor_margin, num_rows - 1) + 1):
+                if self.view.isRowHidden(row):
+                    continue
+                name = self.row_names[row]
+                keep.add(name)
+                if row >= first and row <= last and name not in self.editors:
+                    self.build_editor(row)
+            for name in list(self.editors.keys()):
+                if name not in keep:
+                    self.destroy_editor(name)
+
+    # This is called from a ros thread, possibly far faster than the gui can redraw,
+    # only the latest value of each param is kept until the gui gets to it
     def config_callback(self, config):
+        with self.pending_lock:
+            scheduled = len(self.pending_config) > 0
+            self.pending_config.update(config)
+            self.num_configs += 1
+            if scheduled:
+                self.num_configs_merged += 1
+        if not scheduled:
+            self.do_update_config.emit()
+
+    def schedule_config(self):
+        if not self.config_timer.isActive():
+            self.config_timer.start()
+
+    def apply_pending_config(self):
+        with self.pending_lock:
+            config = self.pending_config
+            self.pending_config = {}
         # The first config/description callback happen out of order-
         # the description is updated after the config, so need to store it.
-        self.do_update_config.emit(config)
+        t0 = time.time()
+        self.update_config(config)
+        self.redraws.add(time.time() - t0)
 
     def update_config(self, config):
         if not config:
             return
-        if not self.described:
-            self.config = config
-            return
         # if not self.client:
         #     return
         rospy.logdebug(config)
         with self.lock:
+            self.config.update(config)
+            if not self.described:
+                return
             self.update_config_inner(config)
 
+    def format_value(self, param_name, value):
+        if self.params[param_name]['type'] != 'double':
+            return str(value)
+        max_dec = 11
+        # text = str(val)
+        num_before_decimal = len(str(int(value)))
+        num_after_decimal = max(max_dec - num_before_decimal - 1, 1)
+        text = "{:0.{prec}f}".format(value, prec=num_after_decimal)
+        if True:
+            text = text.rstrip("0")
+            if text[-1] == '.':
+                text += "0"
+        if len(text) > max_dec:
+            text = "{:g}".format(value)
+        # print(param_name, num_before_decimal, num_after_decimal, val, text, len(text))
+        return text
+
+    # Only params with new values are touched, rows without an editor only
+    # get their text updated, the editor picks up the value when it is created
     def update_config_inner(self, config):
+        num_changed = 0
         for param_name in config.keys():
-            if param_name not in self.widget.keys():
+            if param_name not in self.params:
+                continue
+            value = config[param_name]
+            if param_name not in self.edited and param_name in self.values and \
+                    self.values[param_name] == value:
                 continue
-            try:
-                if param_name in self.val_label.keys() and param_name in self.params.keys():
-                    if self.params[param_name]['type'] == 'int':
-                        text = str(config[param_name])
+            self.edited.discard(param_name)
+            num_changed += 1
+            self.values[param_name] = value
+            self.value_items[param_name].setText(self.format_value(param_name, value))
+            if param_name in self.widget:
+                self.set_editor_value(param_name, value)
+        rospy.logdebug("config: {} of {} changed".format(num_changed, len(config)))
+
+    # Signals from the editor are blocked, setting it to the value from
+    # the server isn't an edit that needs to be sent back
+    def set_editor_value(self, param_name, value):
+        try:
+            if param_name in self.val_label.keys():
+                self.val_label[param_name].setText(self.format_value(param_name, value))
+            widget = self.widget[param_name]
+            was_blocked = widget.blockSignals(True)
+            if isinstance(widget, QSlider):
+                if self.use_div[param_name]:
+                    min_val = self.params[param_name]['min']
+                    max_val = self.params[param_name]['max']
+                    if min_val != max_val:
+                        value = (self.div * (value - min_val) / (max_val - min_val))
                     else:
-                        val = config[param_name]
-                        max_dec = 11
-                        # text = str(val)
-                        num_before_decimal = len(str(int(val)))
-                        num_after_decimal = max(max_dec - num_before_decimal - 1, 1)
-                        text = "{:0.{prec}f}".format(config[param_name], prec=num_after_decimal)
-                        if True:
-                            text = text.rstrip("0")
-                            if text[-1] == '.':
-                                text += "0"
-                        if len(text) > max_dec:
-                            text = "{:g}".format(config[param_name])
-                        # print(param_name, num_before_decimal, num_after_decimal, val, text, len(text))
-                    self.val_label[param_name].setText(text)
-                # TODO(lucasw) also need to change slider
-                value = config[param_name]
-                if isinstance(self.widget[param_name], QSlider):
-                    try:
-                        self.widget[param_name].valueChanged.disconnect()
-                    except TypeError as e:
-                        # TOOD(lucasw) not sure in what circumstances this fails
-                        rospy.logwarn(param_name + " disconnect failed " + str(e))
-                        # TODO(lucasw) if that failed will the connect work?
-                    if self.use_div[param_name]:
-                        min_val = self.params[param_name]['min']
-                        max_val = self.params[param_name]['max']
-                        if min_val != max_val:
-                            old_val = value
-                            value = (self.div * (value - min_val) / (max_val - min_val))
-                            # if self.use_div[param_name]:
-                            #     print('update config', param_name, old_val, value, min_val, max_val)
-                        else:
-                            value = self.div
-                    try:
-                        self.widget[param_name].setValue(int(value))
-                        self.widget[param_name].valueChanged.connect(self.connections[param_name])
-                    except TypeError as ex:
-                        rospy.logerr("{} {} {}".format(param_name, value, ex))
-                elif isinstance(self.widget[param_name], QLineEdit):
-                    self.widget[param_name].setText(value)
-                elif isinstance(self.widget[param_name], QCheckBox):
-                    self.widget[param_name].setChecked(value)
-                elif isinstance(self.widget[param_name], QComboBox):
-                    try:
-                        self.widget[param_name].setCurrentIndex(self.enum_inds[param_name][value])
-                    except KeyError as ex:
-                        rospy.logerr("{} {} {}".format(param_name, value, ex))
-            except RuntimeError as ex:
-                pass
-                # rospy.logerr(param_name + str(ex))
-                # self.reset(use_lock=False)
-                # break
+                        value = self.div
+                try:
+                    widget.setValue(int(value))
+                except TypeError as ex:
+                    rospy.logerr("{} {} {}".format(param_name, value, ex))
+            elif isinstance(widget, QLineEdit):
+                widget.setText(value)
+            elif isinstance(widget, QCheckBox):
+                widget.setChecked(value)
+            elif isinstance(widget, QComboBox):
+                try:
+                    widget.setCurrentIndex(self.enum_inds[param_name][value])
+                except KeyError as ex:
+                    rospy.logerr("{} {} {}".format(param_name, value, ex))
+            widget.blockSignals(was_blocked)
+        except RuntimeError as ex:
+            pass
+            # rospy.logerr(param_name + str(ex))
+            # self.reset(use_lock=False)
+            # break
+
+    def set_changed(self, name, value):
+        self.sender.send({name: value})
+        # the gui no longer shows what the server has
+        self.edited.add(name)
 
     def text_resend(self, name):
-        self.changed_value[name] = self.widget[name].text()
-        # TODO(lucasw) wanted to avoid these with a timered loop, but doing it direct for now
-        # self.do_update_dr.emit()
+        self.set_changed(name, self.widget[name].text())
 
     def enum_changed(self, name, ind):
         if ind not in self.enum_values[name].keys():
@@ -430,15 +713,11 @@ class DrSingle(Plugin):
         #     rospy.logerr(name + " values ind mismatch " + str(ind) + " " +
         #                  str(self.enum_values[name].keys()))
         #     return
-        self.changed_value[name] = self.enum_values[name][ind]
-        # TODO(lucasw) wanted to avoid these with a timered loop, but doing it direct for now
-        # self.do_update_dr.emit()
+        self.set_changed(name, self.enum_values[name][ind])
 
     def text_changed(self, name):
         value = float(self.val_label[name].text())
-        self.changed_value[name] = value
-        # TODO(lucasw) wanted to avoid these with a timered loop, but doing it direct for now
-        # self.do_update_dr.emit()
+        self.set_changed(name, value)
 
     def value_changed(self, name, value, min_val=None, max_val=None):
         if self.use_div[name]:
@@ -447,9 +726,7 @@ class DrSingle(Plugin):
             old_val = value
             value = min_val + (max_val - min_val) * value / self.div
             # print('val changed', name, old_val, value, min_val, max_val, self.div)
-        self.changed_value[name] = value
-        # TODO(lucasw) wanted to avoid these with a timered loop, but doing it direct for now
-        # self.do_update_dr.emit()
+        self.set_changed(name, value)
 
     def update_checkbox(self, value):
         self.connected_checkbox.setChecked(value)
@@ -457,7 +734,7 @@ class DrSingle(Plugin):
     def connect_dr(self):
         with self.lock:
             server_name = self.server_name
-        if server_name is None:
+        if server_name is None or not self.settings_restored:
             return
         try:
             # TODO(lucasw) surely this timeout has nothing to do with ros time
@@ -465,68 +742,150 @@ class DrSingle(Plugin):
             # This takes up 0.3 second no matter what
             # and seems to block the main gui thread  though I haven't
             # exhausted options for running it in other threads
-            self.client = Client(server_name, timeout=0.2,
-                                 config_callback=self.config_callback,
-                                 description_callback=self.description_callback)
+            self.client = self.clients.acquire(server_name, self.config_callback,
+                                               self.description_callback, timeout=0.2)
+            self.sender.set_client(self.client)
             self.do_update_checkbox.emit(True)
         except Exception as ex:  # ROSException:
             rospy.logdebug("no server " + str(server_name))
 
-    def update_dr_configuration(self, evt):
+    def release_client(self):
+        self.sender.set_client(None)
         if self.client is None:
             return
-        if len(self.changed_value.keys()) > 0:
-            update_timeout = 2.0
-            # TODO(lucasw) could follow
-            # https://stackoverflow.com/questions/2829329/catch-a-threads-exception-in-the-caller-thread-in-python
-            # and pass a message back if the update configuration fails
-            t0 = rospy.Time.now()
-            try:
-                th1 = threading.Thread(target=self.client.update_configuration,
-                                       args=[self.changed_value])
-                th1.start()
-                t1 = rospy.Time.now()
-                while ((rospy.Time.now() - t1).to_sec() < update_timeout):
-                    if th1.is_alive():
-                        rospy.sleep(0.02)
-                    else:
-                        break
-                if th1.is_alive():
-                    # TODO(lucasw) how to kill t1- or does it matter?
-                    raise RuntimeError("timeout")
-            except Exception as ex:
-                elapsed = (rospy.Time.now() - t0).to_sec()
-                text = ("lost connection to server"
-                        + str(self.server_name)
-                        + " after elapsed: "
-                        + str(s))
-                rospy.logerr(text)
-                rospy.logerr(ex)
-                self.client = None
-                self.do_update_checkbox.emit(False)
-                return
-            self.changed_value = {}
+        self.clients.release(self.client, self.config_callback, self.description_callback)
+        self.client = None
+
+    # these are called from the sender thread
+    def send_done_callback(self, delta, config, elapsed, waited):
+        self.do_send_done.emit(len(delta), elapsed, waited)
+
+    def send_failed_callback(self, delta, ex):
+        self.do_send_failed.emit(str(ex))
+
+    def send_rejected_callback(self, delta, ex):
+        self.do_send_rejected.emit(list(delta.keys()), str(ex))
+
+    def send_done(self, num_params, elapsed, waited):
+        rospy.logdebug("sent {} params in {:0.3f}s after {:0.3f}s".format(num_params, elapsed, waited))
+        self.round_trips.add(waited + elapsed)
+
+    # the unsent edits stay with the sender until there is a new connection
+    # TODO(lucasw) a server that hangs instead of going away leaves the sender
+    # waiting on it, edits keep being merged but nothing else gets sent
+    def send_failed(self, text):
+        rospy.logerr("lost connection to server {}: {}".format(self.server_name, text))
+        self.release_client()
+        self.do_update_checkbox.emit(False)
+
+    # The server is still there, it only refused these values.
+    # The editors go back to the last values from the server, which may not
+    # send a new config for a request it refused.
+    def send_rejected(self, names, text):
+        rospy.logwarn("server {} rejected {}: {}".format(self.server_name, names, text))
+        for name in names:
+            self.edited.discard(name)
+            if name not in self.values or name not in self.value_items:
+                continue
+            value = self.values[name]
+            self.value_items[name].setText(self.format_value(name, value))
+            if name in self.widget:
+                self.set_editor_value(name, value)
+
+    def update_stats(self):
+        sender = self.sender.stats()
+        with self.pending_lock:
+            num_configs = self.num_configs
+            num_configs_merged = self.num_configs_merged
+        stats = []
+        for name, samples in [('round_trip', self.round_trips), ('redraw', self.redraws)]:
+            percentiles = samples.percentiles()
+            if percentiles is None:
+                continue
+            for label, value in zip(['p50', 'p90', 'p99'], percentiles):
+                stats.append(("{}_{}_ms".format(name, label), value * 1000.0))
+        stats.extend([
+            ('queue_depth', sender['pending']),
+            ('in_flight', int(sender['in_flight'])),
+            ('edits', sender['edits']),
+            ('coalesced_edits', sender['merged']),
+            ('sends', sender['calls']),
+            ('failed_sends', sender['failed']),
+            ('configs', num_configs),
+            ('coalesced_configs', num_configs_merged),
+            ('redraws', self.redraws.count),
+        ])
+
+        text = ""
+        percentiles = self.round_trips.percentiles()
+        if percentiles is not None:
+            text += "round trip ms p50 {:0.1f} p90 {:0.1f} p99 {:0.1f}, ".format(*[v * 1000.0 for v in percentiles])
+        text += "queue {}{}, coalesced edits {} configs {}, failed {}".format(
+            sender['pending'], " +1" if sender['in_flight'] else "",
+            sender['merged'], num_configs_merged, sender['failed'])
+        percentiles = self.redraws.percentiles()
+        if percentiles is not None:
+            text += ", redraw ms p50 {:0.1f} p99 {:0.1f}".format(percentiles[0] * 1000.0, percentiles[2] * 1000.0)
+        self.stats_label.setText(text)
+
+        status = DiagnosticStatus()
+        status.name = "rqt_dr_single {}".format(self.server_name)
+        if self.client is None:
+            status.level = DiagnosticStatus.WARN
+            status.message = "not connected"
+        else:
+            status.level = DiagnosticStatus.OK
+            status.message = "connected"
+        status.values = [KeyValue(key, str(value)) for key, value in stats]
+        msg = DiagnosticArray()
+        msg.header.stamp = rospy.Time.now()
+        msg.status = [status]
+        self.diagnostics_pub.publish(msg)
 
     def shutdown_plugin(self):
         # self.reset()
         # TODO unregister all publishers here
-        self.timer.stop()
+        if self.show_stats:
+            self.stats_timer.stop()
+            self.diagnostics_pub.unregister()
+        self.discovery.unsubscribe(self.servers_callback)
+        self.release_client()
+        self.sender.shutdown()
 
     def save_settings(self, plugin_settings, instance_settings):
         rospy.logdebug("saving server " + self.server_name)
         instance_settings.set_value('server_name', self.server_name)
         instance_settings.set_value('hide_dropdown', self.hide_dropdown)
+        instance_settings.set_value('include', self.include)
+        instance_settings.set_value('exclude', self.exclude)
         # goes to ~/.config/ros.org/rqt_gui.ini, or into .perspective
 
-    # This is called after init
+    # This is called after init, which leaves connecting to the server to here
     def restore_settings(self, plugin_settings, instance_settings):
+        # before connecting to the server so rows for params this panel
+        # doesn't show are never built
+        include = self.include
+        exclude = self.exclude
+        if instance_settings.contains('include') and include is None:
+            include = instance_settings.value('include')
+        if instance_settings.contains('exclude') and exclude is None:
+            exclude = instance_settings.value('exclude')
+        if include != self.include or exclude != self.exclude:
+            self.set_selection(include, exclude)
+        self.settings_restored = True
+
         if instance_settings.contains('server_name') and self.server_name is None:
             with self.lock:
                 self.server_name = instance_settings.value('server_name')
             rospy.logdebug("restore server " + self.server_name)
             self.update_topic_list()
+        # the server from ~server_name, or the restored one if that didn't connect
+        if self.client is None:
+            self.connect_dr()
         if self.server_name is None:
-            self.server_changed(0)
+            # choose the first server now, or when one is discovered
+            self.auto_select = True
+            self.select_first_server()
 
         if instance_settings.contains('hide_dropdown') and self.hide_dropdown is None:
             # instance settings don't resolve as True of False boolean
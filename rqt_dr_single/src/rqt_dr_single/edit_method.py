@@ -0,0 +1,52 @@
+# Lucas Walter
+# Parse the edit_method string of an enum param, which is the repr of a dict like
+#   {'enum': [{'name': 'Small', 'type': 'int', 'value': 0, ...}, ...],
+#    'enum_description': '...'}
+# with ast.literal_eval instead of eval, since it comes from the network.
+# The result is cached by the string, shared by every panel in the process.
+
+import ast
+import collections
+import rospy
+import threading
+
+# labels for the combobox, and the maps between combobox index and enum value
+EnumTable = collections.namedtuple('EnumTable', ['labels', 'values', 'indices'])
+
+cache = {}
+cache_lock = threading.Lock()
+
+
+def parse_enum(edit_method):
+    edit = ast.literal_eval(edit_method)
+    if not isinstance(edit, dict) or not isinstance(edit.get('enum', None), list):
+        raise ValueError("no enum list in edit_method")
+    labels = []
+    values = {}
+    indices = {}
+    for ind, enum in enumerate(edit['enum']):
+        name = enum['name']
+        value = enum['value']
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError("enum {} has unsupported value {}".format(name, value))
+        labels.append(str(name) + ' (' + str(value) + ')')
+        values[ind] = value
+        indices[value] = ind
+    return EnumTable(labels, values, indices)
+
+
+# Returns None for an edit_method that can't be parsed, the error is
+# only logged the first time it is seen.
+# The tables are shared so callers must not modify them.
+def get_enum(edit_method):
+    with cache_lock:
+        if edit_method in cache:
+            return cache[edit_method]
+    try:
+        table = parse_enum(edit_method)
+    except (ValueError, SyntaxError, TypeError, KeyError, MemoryError, RecursionError) as ex:
+        rospy.logerr("couldn't parse enum edit_method '{}': {}".format(edit_method[:200], ex))
+        table = None
+    with cache_lock:
+        cache[edit_method] = table
+    return table
@@ -0,0 +1,24 @@
+# Lucas Walter
+# Keep the most recent timing samples and summarize them with percentiles.
+
+import collections
+
+
+class Samples():
+    def __init__(self, max_len=500):
+        self.samples = collections.deque(maxlen=max_len)
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def __len__(self):
+        return len(self.samples)
+
+    # nearest rank percentiles of the samples kept, None if there aren't any
+    def percentiles(self, fractions=(0.5, 0.9, 0.99)):
+        if not self.samples:
+            return None
+        values = sorted(self.samples)
+        return [values[min(int(fraction * len(values)), len(values) - 1)] for fraction in fractions]